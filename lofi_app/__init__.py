@@ -1 +1 @@
-__all__ = ["app", "dsp", "presets"]
+__all__ = ["app", "bench", "cli", "decode_cache", "dsp", "parallel", "presets", "render_cache", "streaming"]
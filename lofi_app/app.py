@@ -1,11 +1,215 @@
 import sys
-import tempfile
+import threading
 from pathlib import Path
 
+import numpy as np
 from PySide6 import QtCore, QtMultimedia, QtWidgets
 
-from lofi_app import dsp, presets
-from lofi_app.io import load_audio, save_audio
+from lofi_app import dsp, presets, streaming
+from lofi_app.decode_cache import DecodeCache
+from lofi_app.io import save_audio
+from lofi_app.profiling import StageProfiler
+from lofi_app.render_cache import RenderCache
+
+
+class _RenderCancelled(Exception):
+    pass
+
+
+class RenderWorker(QtCore.QThread):
+    """Runs dsp.apply_pipeline (through the render cache) off the GUI thread, reporting per-stage progress
+
+    With an ``output_path``, the render is encoded there on this thread too;
+    ``saved`` is then (path written, encoder error or None).
+    """
+
+    progress = QtCore.Signal(int, int, str)
+    rendered = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+
+    def __init__(self, audio, sr, params, cache, render_cache, output_path=None):
+        super().__init__()
+        self.audio = audio
+        self.sr = sr
+        self.params = params
+        self.cache = cache
+        self.render_cache = render_cache
+        self.output_path = output_path
+        self.saved = None
+        self.profiler = StageProfiler()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            processed = self.render_cache.render(
+                self.audio, self.sr, self.params, cache=self.cache, progress=self._report, observer=self.profiler
+            )
+            if self.output_path is not None and not self._cancelled.is_set():
+                self.progress.emit(1, 1, f"encoding {Path(self.output_path).name}")
+                self.saved = self._save(processed)
+        except _RenderCancelled:
+            return
+        except Exception as exc:
+            self.failed.emit(str(exc))
+            return
+        if not self._cancelled.is_set():
+            self.rendered.emit(processed)
+
+    def _report(self, done, total, stage):
+        if self._cancelled.is_set():
+            raise _RenderCancelled
+        self.progress.emit(done, total, stage)
+
+    def _save(self, processed):
+        """Encode to output_path in the format its extension names, or to a WAV beside it if that fails"""
+        try:
+            save_audio(self.output_path, processed, self.sr)
+            return self.output_path, None
+        except Exception as exc:
+            if Path(self.output_path).suffix.lower() == ".wav":
+                raise
+            fallback = str(Path(self.output_path).with_suffix(".wav"))
+            save_audio(fallback, processed, self.sr)
+            return fallback, str(exc)
+
+
+PREVIEW_BLOCK_SIZE = 16384
+# Seconds of output rendered for a preview, from the last playback position
+PREVIEW_SECONDS = 15
+# Rendered audio held ahead of the playback position
+PREVIEW_BUFFER_SECONDS = 10
+
+
+class PreviewBuffer(QtCore.QIODevice):
+    """Pull-mode QAudioSink source fed with float32 blocks from a render thread.
+
+    ``put`` blocks while ``capacity`` bytes are queued, so rendering only runs
+    a bounded distance ahead of playback. Underruns play silence.
+    """
+
+    def __init__(self, channels, capacity):
+        super().__init__()
+        self.frame_bytes = 4 * channels
+        self.capacity = capacity
+        self._data = bytearray()
+        self._finished = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, block):
+        """Queue a (frames, channels) block; return False once the stream is closed."""
+        data = np.ascontiguousarray(block, dtype=np.float32).tobytes()
+        with self._cond:
+            while len(self._data) >= self.capacity and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return False
+            self._data += data
+        return True
+
+    def finish(self):
+        with self._cond:
+            self._finished = True
+
+    def close_stream(self):
+        with self._cond:
+            self._closed = True
+            self._data.clear()
+            self._cond.notify_all()
+
+    def drained(self):
+        with self._cond:
+            return (self._finished or self._closed) and not self._data
+
+    def isSequential(self):
+        return True
+
+    def bytesAvailable(self):
+        return len(self._data) + super().bytesAvailable()
+
+    def readData(self, maxlen):
+        maxlen -= maxlen % self.frame_bytes
+        with self._cond:
+            if not self._data:
+                return b"" if self._finished or self._closed else bytes(maxlen)
+            chunk = bytes(self._data[:maxlen])
+            del self._data[:maxlen]
+            self._cond.notify_all()
+        return chunk
+
+    def writeData(self, data):
+        return -1
+
+
+class PreviewWorker(QtCore.QThread):
+    """Renders a preview window with streaming.iter_pipeline into a PreviewBuffer, block by block
+
+    The window follows dsp.window_bounds: pre-roll long enough for the reverb
+    tail (dsp.pre_roll_seconds) is rendered to warm the stages and then
+    dropped before anything reaches the buffer.
+    """
+
+    first_block = QtCore.Signal()
+    window_done = QtCore.Signal()
+    failed = QtCore.Signal(str)
+
+    def __init__(self, audio, sr, params, buffer, start=0.0, duration=PREVIEW_SECONDS):
+        super().__init__()
+        self.audio = audio
+        self.sr = sr
+        self.params = params
+        self.buffer = buffer
+        self.start_seconds = start
+        self.duration = duration
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        in_start, in_stop, skip, remaining = dsp.window_bounds(
+            len(self.audio), self.sr, self.params, self.start_seconds, self.duration
+        )
+        blocks = (self.audio[i:min(i + PREVIEW_BLOCK_SIZE, in_stop)] for i in range(in_start, in_stop, PREVIEW_BLOCK_SIZE))
+        ceiling = self.params.get("limiter", 0.95)
+        peak = 0.0
+        started = False
+        try:
+            for block in streaming.iter_pipeline(blocks, self.sr, self.audio.shape[1], self.params):
+                if self._cancelled.is_set():
+                    return
+                dropped = min(skip, len(block))
+                skip -= dropped
+                block = block[dropped:remaining + dropped]
+                remaining -= len(block)
+                if not len(block):
+                    if remaining <= 0:
+                        break
+                    continue
+                # The whole-track peak is not known yet, so limit against the
+                # loudest block so far; this matches the render once the
+                # loudest passage has played.
+                peak = max(peak, float(np.max(np.abs(block))))
+                if 0.0 < ceiling < peak:
+                    block = block * ((ceiling / peak) * 0.95)
+                if not self.buffer.put(block):
+                    return
+                if not started:
+                    started = True
+                    self.first_block.emit()
+        except Exception as exc:
+            self.failed.emit(str(exc))
+            return
+        finally:
+            self.buffer.finish()
+        if not started and not self._cancelled.is_set():
+            self.failed.emit("nothing to play")
+            return
+        if not self._cancelled.is_set():
+            self.window_done.emit()
 
 
 class MainWindow(QtWidgets.QMainWindow):
@@ -18,13 +222,23 @@ class MainWindow(QtWidgets.QMainWindow):
         self.audio = None
         self.sample_rate = None
         self.processed_audio = None
+        # Intermediate stage outputs, so moving a late-stage slider only reruns the tail
+        self.stage_cache = dsp.StageCache()
+        # Finished renders, kept across file loads since they are keyed by content
+        self.render_cache = RenderCache()
+        self.decode_cache = DecodeCache()
+        self._render_worker = None
+        self._render_profile = None
+        self._fill_worker = None
+        self._workers = set()
+        self._position = 0.0
         
         # Audio playback
         self.player = QtMultimedia.QMediaPlayer()
         self.audio_output = QtMultimedia.QAudioOutput()
         self.player.setAudioOutput(self.audio_output)
-        self.temp_playback_file = None
         self.is_playing_processed = False
+        self._preview = None
 
         # Apply dark theme
         self._apply_dark_theme()
@@ -105,12 +319,13 @@ class MainWindow(QtWidgets.QMainWindow):
         layout.addLayout(controls_layout)
 
         # Color-coded sliders with emojis
-        self._add_slider(controls_layout, "🔥 Warmth", "saturation", 0.0, 1.0, 0.6, 0, 0, "#FF6B6B")
-        self._add_slider(controls_layout, "🌊 Wobble", "wow_flutter", 0.0, 1.0, 0.25, 0, 1, "#4ECDC4")
-        self._add_slider(controls_layout, "📻 Noise", "noise", 0.0, 0.5, 0.12, 1, 0, "#95E1D3")
-        self._add_slider(controls_layout, "🏠 Room", "reverb", 0.0, 0.8, 0.2, 1, 1, "#A8E6CF")
-        self._add_slider(controls_layout, "⏱️ Tempo", "time_stretch", 0.8, 1.05, 0.92, 2, 0, "#FFD93D")
-        self._add_slider(controls_layout, "🎵 Pitch", "pitch_shift", -4.0, 2.0, -2.0, 2, 1, "#FFA07A")
+        self._add_slider(controls_layout, "🔥 Warmth", "saturation", 0.6, 0, 0, "#FF6B6B")
+        self._add_slider(controls_layout, "🌊 Wobble", "wow_flutter", 0.25, 0, 1, "#4ECDC4")
+        self._add_slider(controls_layout, "📻 Noise", "noise", 0.12, 1, 0, "#95E1D3")
+        self._add_slider(controls_layout, "🏠 Room", "reverb", 0.2, 1, 1, "#A8E6CF")
+        self._add_slider(controls_layout, "⏱️ Tempo", "time_stretch", 0.92, 2, 0, "#FFD93D")
+        self._add_slider(controls_layout, "🎵 Pitch", "pitch_shift", -2.0, 2, 1, "#FFA07A")
+        self._add_slider(controls_layout, "📼 Tape Speed", "varispeed", 1.0, 3, 0, "#C3A6FF")
 
         # Progress bar
         self.progress_bar = QtWidgets.QProgressBar()
@@ -265,7 +480,8 @@ class MainWindow(QtWidgets.QMainWindow):
             }
         """)
 
-    def _add_slider(self, layout, label, key, min_val, max_val, default, row, col, color="#667EEA"):
+    def _add_slider(self, layout, label, key, default, row, col, color="#667EEA"):
+        min_val, max_val = presets.SLIDER_RANGES[key]
         container = QtWidgets.QWidget()
         container.setStyleSheet(f"""
             QWidget {{
@@ -310,13 +526,16 @@ class MainWindow(QtWidgets.QMainWindow):
             }}
         """)
         slider.setMinimum(0)
-        slider.setMaximum(100)
-        slider.setValue(int((default - min_val) / (max_val - min_val) * 100))
+        slider.setMaximum(presets.SLIDER_STEPS)
+        slider.setValue(presets.slider_position(key, default))
         
         # Connect slider to update value label
         slider.valueChanged.connect(
             lambda: value_label.setText(f"{self._slider_value(key):.2f}")
         )
+        # A render of the old settings is stale as soon as a slider moves
+        slider.valueChanged.connect(lambda: self._cancel_render())
+        slider.valueChanged.connect(lambda: self._cancel_fill())
 
         vbox.addLayout(title_layout)
         vbox.addWidget(slider)
@@ -331,19 +550,21 @@ class MainWindow(QtWidgets.QMainWindow):
             "default": default,
         }
 
+    def _current_params(self):
+        """The selected preset with the slider values on top"""
+        params = dict(presets.PRESETS.get(self.preset_box.currentText(), {}))
+        params.update({key: self._slider_value(key) for key in self.controls})
+        return params
+
     def _slider_value(self, key):
-        config = self.controls[key]
-        slider = config["slider"]
-        return config["min"] + (config["max"] - config["min"]) * (slider.value() / 100)
+        return presets.slider_value(key, self.controls[key]["slider"].value())
 
     def apply_preset(self, name):
         preset = presets.PRESETS.get(name, {})
         for key, config in self.controls.items():
             if key not in preset:
                 continue
-            value = preset[key]
-            ratio = (value - config["min"]) / (config["max"] - config["min"])
-            config["slider"].setValue(int(ratio * 100))
+            config["slider"].setValue(presets.slider_position(key, preset[key]))
 
     def reset_to_preset(self):
         """Reset all controls to current preset values"""
@@ -360,16 +581,22 @@ class MainWindow(QtWidgets.QMainWindow):
         if not path:
             return
         try:
-            audio, sr = load_audio(path)
+            # Compressed files are decoded once and cached, float WAVs are memory-mapped
+            audio, sr = self.decode_cache.load(path)
         except Exception as exc:
             self.status.setText(f"Failed to load audio: {exc}")
             return
+        self._cancel_render()
+        self._cancel_fill()
+        self._position = 0.0
         self.audio_path = Path(path)
-        self.audio = audio.astype("float32")
+        self.audio = audio
+        self.stage_cache.clear()
         self.sample_rate = sr
         self.file_label.setText(f"Loaded: {self.audio_path.name}")
         self.status.setText("Ready.")
         self.play_original_btn.setEnabled(True)
+        self.play_processed_btn.setEnabled(True)
 
     def play_original(self):
         """Play the original audio file"""
@@ -382,41 +609,86 @@ class MainWindow(QtWidgets.QMainWindow):
         self.status.setText("▶️ Playing original...")
 
     def play_processed(self):
-        """Play processed audio with current settings"""
+        """Stream the current settings to the audio device as they render"""
         if self.audio is None:
             return
-        
+
         self.stop_playback()
-        self.status.setText("Processing preview...")
-        QtWidgets.QApplication.processEvents()
-        
-        # Apply current settings
-        params = {key: self._slider_value(key) for key in self.controls}
-        processed = dsp.apply_pipeline(self.audio, self.sample_rate, params)
-        
-        # Save to temp file
-        if self.temp_playback_file:
-            try:
-                Path(self.temp_playback_file).unlink()
-            except:
-                pass
-        
-        temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        self.temp_playback_file = temp_file.name
-        temp_file.close()
-        
-        save_audio(self.temp_playback_file, processed, self.sample_rate)
-        
-        # Play temp file
-        self.player.setSource(QtCore.QUrl.fromLocalFile(self.temp_playback_file))
-        self.player.play()
+        params = self._current_params()
+        channels = self.audio.shape[1]
+        fmt = QtMultimedia.QAudioFormat()
+        fmt.setSampleRate(self.sample_rate)
+        fmt.setChannelCount(channels)
+        fmt.setSampleFormat(QtMultimedia.QAudioFormat.Float)
+
+        buffer = PreviewBuffer(channels, capacity=self.sample_rate * channels * 4 * PREVIEW_BUFFER_SECONDS)
+        buffer.open(QtCore.QIODevice.ReadOnly)
+        sink = QtMultimedia.QAudioSink(QtMultimedia.QMediaDevices.defaultAudioOutput(), fmt)
+        sink.stateChanged.connect(lambda state: self._on_sink_state(sink, buffer, state))
+        worker = PreviewWorker(self.audio, self.sample_rate, params, buffer, start=self._position)
+        worker.first_block.connect(lambda: self._on_preview_ready(worker, sink, buffer))
+        worker.window_done.connect(lambda: self._fill_cache(params))
+        worker.failed.connect(lambda message: self._on_preview_failed(worker, message))
+        self._workers.add(worker)
+        worker.finished.connect(lambda: self._workers.discard(worker))
+        self._preview = (worker, sink, buffer)
+
+        self.status.setText(f"Processing preview from {self._position:.0f}s...")
+        worker.start()
+
+    def _fill_cache(self, params):
+        """Render the whole track into the caches in the background, so export reuses it"""
+        self._cancel_fill()
+        worker = RenderWorker(self.audio, self.sample_rate, params, self.stage_cache, self.render_cache)
+        self._workers.add(worker)
+        worker.finished.connect(lambda: self._workers.discard(worker))
+        self._fill_worker = worker
+        worker.start()
+
+    def _cancel_fill(self):
+        if self._fill_worker is not None:
+            self._fill_worker.cancel()
+            self._fill_worker = None
+
+    def _on_preview_ready(self, worker, sink, buffer):
+        if self._preview is None or self._preview[0] is not worker:
+            return
+        sink.start(buffer)
         self.is_playing_processed = True
         self.status.setText("▶️ Playing lofi preview...")
-        self.play_processed_btn.setEnabled(True)
+
+    def _on_preview_failed(self, worker, message):
+        if self._preview is None or self._preview[0] is not worker:
+            return
+        self._stop_preview()
+        self.status.setText(f"Preview failed: {message}")
+
+    def _on_sink_state(self, sink, buffer, state):
+        # The sink goes idle once the buffer has been drained after the last block
+        if state == QtMultimedia.QAudio.State.IdleState and buffer.drained():
+            sink.stop()
+            if self._preview is not None and self._preview[1] is sink:
+                self._preview = None
+                self.is_playing_processed = False
+                self.status.setText("Preview finished.")
+
+    def _stop_preview(self):
+        if self._preview is None:
+            return
+        worker, sink, buffer = self._preview
+        self._preview = None
+        worker.cancel()
+        buffer.close_stream()
+        sink.stop()
+        self.is_playing_processed = False
 
     def stop_playback(self):
         """Stop audio playback"""
+        # Previews start where the original was stopped
+        if self.player.playbackState() != QtMultimedia.QMediaPlayer.PlaybackState.StoppedState:
+            self._position = self.player.position() / 1000
         self.player.stop()
+        self._stop_preview()
         if self.audio_path:
             self.status.setText("Playback stopped.")
         else:
@@ -427,74 +699,107 @@ class MainWindow(QtWidgets.QMainWindow):
             self.status.setText("Load an audio file first.")
             return
 
-        params = {key: self._slider_value(key) for key in self.controls}
-        
-        # Show progress bar
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setValue(0)
-        self.status.setText("Processing audio...")
-        QtWidgets.QApplication.processEvents()
-
-        # Simulate progress (in real scenario, you'd update during processing)
-        self.progress_bar.setValue(30)
-        QtWidgets.QApplication.processEvents()
-
-        processed = dsp.apply_pipeline(self.audio, self.sample_rate, params)
-        self.processed_audio = processed
-
-        self.progress_bar.setValue(70)
-        QtWidgets.QApplication.processEvents()
-
         output_path, _ = QtWidgets.QFileDialog.getSaveFileName(
             self,
             "Save Lofi Audio",
             str(self.audio_path.with_suffix(".lofi.wav")),
-            "Audio Files (*.wav *.mp3)",
+            "Audio Files (*.wav *.flac *.mp3 *.ogg)",
         )
         if not output_path:
             self.status.setText("Export canceled.")
-            self.progress_bar.setVisible(False)
             return
-        
-        self.progress_bar.setValue(90)
-        QtWidgets.QApplication.processEvents()
-        
-        # Save based on extension
-        if output_path.endswith('.mp3'):
-            self._save_as_mp3(output_path, processed)
-        else:
-            save_audio(output_path, processed, self.sample_rate)
-        
-        self.progress_bar.setValue(100)
-        self.status.setText(f"✅ Exported to {Path(output_path).name}")
-        
+
+        params = self._current_params()
+        # The worker encodes too, so a long MP3/OGG encode never blocks the window
+        self._start_render(params, self._export, "Processing audio", output_path)
+
+    def _export(self, worker, processed):
+        self.processed_audio = processed
+
+        saved, error = worker.saved
+        if error is not None:
+            name = Path(worker.output_path).name
+            self.status.setText(f"⚠️ Could not encode {name} ({error}); saved {Path(saved).name} instead")
+            return
+
+        summary = f"{self._cache_summary()}{self._profile_summary()}"
+        self.status.setText(f"✅ Exported to {Path(saved).name} ({summary})")
+
+    def _start_render(self, params, on_done, label, output_path=None):
+        """Run the pipeline on a RenderWorker, replacing any render in flight
+
+        ``on_done(worker, processed)`` runs on the GUI thread once the render
+        (and, with an ``output_path``, its encode) has finished.
+        """
+        self._cancel_render()
+        worker = RenderWorker(self.audio, self.sample_rate, params, self.stage_cache, self.render_cache, output_path)
+        worker.progress.connect(lambda done, total, stage: self._on_render_progress(worker, done, total, stage, label))
+        worker.rendered.connect(lambda processed: self._on_render_done(worker, processed, on_done))
+        worker.failed.connect(lambda message: self._on_render_failed(worker, message))
+        # Qt must not destroy a thread that is still running, so hold every
+        # worker (including cancelled ones) until it has actually exited.
+        self._workers.add(worker)
+        worker.finished.connect(lambda: self._workers.discard(worker))
+        self._render_worker = worker
+
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.status.setText(f"{label}...")
+        worker.start()
+
+    def _cancel_render(self):
+        """Abandon the current render; it stops at its next stage boundary"""
+        if self._render_worker is None:
+            return
+        self._render_worker.cancel()
+        self._render_worker = None
+        self.progress_bar.setVisible(False)
+        self.status.setText("Render canceled.")
+
+    def _on_render_progress(self, worker, done, total, stage, label):
+        if worker is not self._render_worker:
+            return
+        self.progress_bar.setValue(int(done / total * 100))
+        self.status.setText(f"{label}... {stage} ({done}/{total})")
+
+    def _on_render_done(self, worker, processed, on_done):
+        if worker is not self._render_worker:
+            return
+        self._render_worker = None
+        self._render_profile = worker.profiler
+        on_done(worker, processed)
         # Hide progress bar after a moment
-        QtCore.QTimer.singleShot(2000, lambda: self.progress_bar.setVisible(False))
+        QtCore.QTimer.singleShot(2000, lambda: self.progress_bar.setVisible(self._render_worker is not None))
 
-    def _save_as_mp3(self, path, audio):
-        """Save audio as MP3 format"""
-        try:
-            import soundfile as sf
-            import subprocess
-            import tempfile
-            
-            # Save as WAV first
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp:
-                tmp_path = tmp.name
-                sf.write(tmp_path, audio, self.sample_rate)
-            
-            # Convert to MP3 using ffmpeg
-            subprocess.run([
-                'ffmpeg', '-i', tmp_path, '-codec:a', 'libmp3lame',
-                '-qscale:a', '2', path, '-y'
-            ], check=True, capture_output=True)
-            
-            # Clean up temp file
-            Path(tmp_path).unlink()
-        except Exception as e:
-            # Fallback to WAV if MP3 fails
-            self.status.setText(f"MP3 export failed, saving as WAV: {e}")
-            save_audio(path.replace('.mp3', '.wav'), audio, self.sample_rate)
+    def _on_render_failed(self, worker, message):
+        if worker is not self._render_worker:
+            return
+        self._render_worker = None
+        self.progress_bar.setVisible(False)
+        self.status.setText(f"Render failed: {message}")
+
+    def closeEvent(self, event):
+        self._cancel_render()
+        self._cancel_fill()
+        self._stop_preview()
+        for worker in list(self._workers):
+            worker.wait()
+        super().closeEvent(event)
+
+    def _cache_summary(self):
+        stats = self.stage_cache.stats()
+        renders = self.render_cache.stats()
+        return (
+            f"render cache: {renders['hits']} hits; "
+            f"stage cache: {stats['hits']} hits / {stats['misses']} misses, "
+            f"{stats['bytes'] / 2**20:.0f} MB"
+        )
+
+    def _profile_summary(self):
+        """Slowest stages of the last render; cached stages did not run and are not listed"""
+        if self._render_profile is None or not self._render_profile.stages:
+            return ""
+        return f"; slowest: {self._render_profile.summary()}"
 
 
 def main():
@@ -0,0 +1,210 @@
+"""DSP benchmarks: ``python -m lofi_app.bench [-o results.json] [--baseline baseline.json]``.
+
+Times every stage of dsp.apply_pipeline, and the whole pipeline, for each
+preset over a grid of durations, sample rates and channel counts, and with
+``--workers`` how parallel.render_parallel scales. Results are written as
+JSON; given a baseline from an earlier run, timings that got slower than
+the tolerance allows are reported and the exit status is 1.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import scipy
+
+from lofi_app import dsp, parallel, presets
+
+DEFAULT_DURATIONS = (10, 60)
+DEFAULT_RATES = (44100,)
+DEFAULT_CHANNELS = (2,)
+# --full: everything from a short clip to a half-hour mix
+FULL_DURATIONS = (10, 60, 300, 1800)
+FULL_RATES = (22050, 44100, 48000, 96000)
+FULL_CHANNELS = (1, 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lofi-bench", description="Benchmark the DSP pipeline per stage.")
+    parser.add_argument("-p", "--preset", nargs="+", choices=list(presets.PRESETS), help="Presets (default: all)")
+    parser.add_argument("-d", "--durations", nargs="+", type=float, help="Input lengths in seconds")
+    parser.add_argument("-r", "--rates", nargs="+", type=int, help="Sample rates")
+    parser.add_argument("-c", "--channels", nargs="+", type=int, help="Channel counts")
+    parser.add_argument("--full", action="store_true", help="Benchmark the full grid (10 s to 30 min, 22.05-96 kHz)")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        nargs="+",
+        type=int,
+        help="Also render in segments on these worker counts, e.g. 2 4 8 16, and report speedup and error",
+    )
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Runs per timing; the fastest is kept")
+    parser.add_argument("-o", "--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline (0.2 = 20%%)"
+    )
+    args = parser.parse_args(argv)
+
+    durations = args.durations or (FULL_DURATIONS if args.full else DEFAULT_DURATIONS)
+    rates = args.rates or (FULL_RATES if args.full else DEFAULT_RATES)
+    channels = args.channels or (FULL_CHANNELS if args.full else DEFAULT_CHANNELS)
+    names = args.preset or list(presets.PRESETS)
+
+    # Pay one-off costs (imports, JIT compilation, filter design caches) before timing
+    warm_up = test_signal(1, rates[0], channels[0])
+    for name in names:
+        benchmark(warm_up, rates[0], presets.PRESETS[name], repeat=1)
+
+    results = []
+    for sr in rates:
+        for n_channels in channels:
+            for duration in durations:
+                audio = test_signal(duration, sr, n_channels)
+                for name in names:
+                    result = benchmark(audio, sr, presets.PRESETS[name], args.repeat)
+                    result.update(preset=name, sr=sr, channels=n_channels, duration=duration)
+                    if args.workers:
+                        result["parallel"] = scaling(audio, sr, presets.PRESETS[name], args.workers, args.repeat)
+                    results.append(result)
+                    _print_result(result)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)
+        regressions = compare(baseline, report, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+
+def test_signal(duration, sr, channels, seed=0):
+    """Reproducible music-like input: a few detuned partials over quiet noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sr), dtype=np.float32) / sr
+    audio = 0.01 * rng.standard_normal((len(t), channels), dtype=np.float32)
+    for freq in (110.0, 220.5, 331.0, 440.0):
+        for ch in range(channels):
+            audio[:, ch] += 0.1 * np.sin(2 * np.pi * (freq + ch) * t)
+    return audio
+
+
+def benchmark(audio, sr, params, repeat=3):
+    """Fastest wall time of each stage and of apply_pipeline on ``audio``, in seconds.
+
+    Stages are timed through their plain functions, each fed the previous
+    stage's output; the pipeline timing includes the in-place kernels
+    apply_pipeline switches to, so it can be less than the stage sum. The
+    plan timing is PipelinePlan.apply with the plan built beforehand, as a
+    batch renders every file after the first.
+    """
+    stages = {}
+    current = audio
+    for name, fn, args in dsp._pipeline_stages(sr, params):
+        elapsed, current = _fastest(lambda: fn(current, *args), repeat)
+        stages[name] = elapsed
+    pipeline, _ = _fastest(lambda: dsp.apply_pipeline(audio, sr, params), repeat)
+    plan = dsp.PipelinePlan(sr, params)
+    planned, _ = _fastest(lambda: plan.apply(audio), repeat)
+    return {"stages": stages, "pipeline": pipeline, "plan": planned, "realtime": len(audio) / sr / pipeline}
+
+
+def scaling(audio, sr, params, worker_counts, repeat=3):
+    """Fastest wall time of parallel.render_parallel at each worker count, in seconds.
+
+    Each entry also has the speedup over apply_pipeline and the largest
+    sample difference from its output. With tempo or pitch changes the stages
+    up to tempo/pitch run serially, which limits the speedup.
+    """
+    serial, reference = _fastest(lambda: dsp.apply_pipeline(audio, sr, params), repeat)
+    results = {}
+    for workers in worker_counts:
+        elapsed, processed = _fastest(lambda: parallel.render_parallel(audio, sr, params, workers), repeat)
+        results[str(workers)] = {
+            "seconds": elapsed,
+            "speedup": serial / elapsed,
+            "max_error": float(np.abs(processed - reference).max()),
+        }
+    return results
+
+
+def compare(baseline, report, tolerance=0.2, floor=0.005):
+    """Descriptions of timings in ``report`` more than ``tolerance`` slower than ``baseline``.
+
+    Entries are matched on (preset, sr, channels, duration); differences
+    under ``floor`` seconds are timer noise and never count.
+    """
+    previous = {_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get(_key(result))
+        if old is None:
+            continue
+        timings = [("pipeline", old["pipeline"], result["pipeline"])]
+        if "plan" in result:
+            timings.append(("plan", old.get("plan"), result["plan"]))
+        timings += [(name, old["stages"].get(name), new) for name, new in result["stages"].items()]
+        timings += [
+            (f"{workers} workers", old.get("parallel", {}).get(workers, {}).get("seconds"), new["seconds"])
+            for workers, new in result.get("parallel", {}).items()
+        ]
+        for name, before, after in timings:
+            if before is not None and after - before > max(tolerance * before, floor):
+                regressions.append(
+                    f"{result['preset']} {result['sr']} Hz {result['channels']}ch {result['duration']:g}s "
+                    f"{name}: {before:.3f}s -> {after:.3f}s (+{(after / before - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def environment():
+    """What the timings depend on besides the code."""
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.system(),
+    }
+
+
+def _fastest(run, repeat):
+    best, output = float("inf"), None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        output = run()
+        best = min(best, time.perf_counter() - started)
+    return best, output
+
+
+def _key(result):
+    return result["preset"], result["sr"], result["channels"], float(result["duration"])
+
+
+def _print_result(result):
+    slowest = sorted(result["stages"].items(), key=lambda item: item[1], reverse=True)[:3]
+    breakdown = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in slowest)
+    print(
+        f"{result['preset']:<16} {result['sr']:>6} Hz {result['channels']}ch {result['duration']:>6g}s: "
+        f"{result['pipeline']:.3f}s ({result['realtime']:.0f}x realtime), planned {result['plan']:.3f}s; "
+        f"slowest {breakdown}"
+    )
+    for workers, timing in result.get("parallel", {}).items():
+        print(
+            f"{'':<16} {workers:>3} workers: {timing['seconds']:.3f}s ({timing['speedup']:.2f}x), "
+            f"max error {timing['max_error']:.1e}"
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,335 @@
+"""Headless batch rendering: ``python -m lofi_app.cli INPUT... -o OUTDIR``."""
+
+import argparse
+import functools
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from lofi_app import dsp, presets
+from lofi_app.decode_cache import DecodeCache
+from lofi_app.io import ENCODER_FORMATS, audio_info, load_audio, save_audio
+from lofi_app.parallel import render_parallel
+from lofi_app.profiling import StageProfiler
+from lofi_app.render_cache import RenderCache
+from lofi_app.render_cache import default_directory as default_render_directory
+from lofi_app.streaming import stream_pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lofi-render", description="Render audio files to lofi without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="Input files or glob patterns")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory for rendered files")
+    parser.add_argument("-p", "--preset", choices=list(presets.PRESETS), help="Preset name")
+    parser.add_argument("--params", help="JSON file of parameters (overrides the preset)")
+    parser.add_argument(
+        "--sweep",
+        nargs="*",
+        choices=list(presets.PRESETS),
+        metavar="PRESET",
+        help="Render every input through these presets (all if none given), sharing common stages",
+    )
+    parser.add_argument(
+        "--mastering", action="store_true", help="Process in float64 instead of float32 (slower, more memory)"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        nargs="+",
+        choices=ENCODER_FORMATS,
+        default=["wav"],
+        help="Output formats; several are encoded from one render",
+    )
+    parser.add_argument(
+        "--decode-cache",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Reuse decoded inputs from an on-disk cache (default location if DIR is omitted)",
+    )
+    parser.add_argument(
+        "--render-cache",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="Skip renders already on disk for the same input and settings, and store new ones (renders in memory)",
+    )
+    parser.add_argument("--profile", action="store_true", help="Print time spent in each stage after the batch")
+    parser.add_argument(
+        "--profile-memory", action="store_true", help="Also report peak allocations per stage (slower)"
+    )
+    parser.add_argument("-j", "--workers", type=_positive_int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument(
+        "--split",
+        type=_positive_int,
+        metavar="N",
+        help="Render each file in segments on N processes (for a few long files; use with -j 1; renders in memory, "
+        "bypassing --render-cache)",
+    )
+    args = parser.parse_args(argv)
+
+    inputs, missing = _expand_inputs(args.inputs)
+    if missing:
+        parser.error(f"input not found: {', '.join(missing)}")
+    if not inputs:
+        parser.error("no input files matched")
+    output_dir = Path(args.output_dir)
+    stems = _output_stems(inputs, output_dir)
+    clashes = _clashes(stems)
+    if clashes:
+        groups = "; ".join(" and ".join(str(path) for path in group) for group in clashes)
+        parser.error(f"inputs would overwrite each other's output: {groups}")
+    for stem in set(stems.values()):
+        stem.parent.mkdir(parents=True, exist_ok=True)
+    # None, or whether the stage profile also traces allocations
+    profile = args.profile_memory if args.profile or args.profile_memory else None
+
+    if args.sweep is not None:
+        if args.preset:
+            parser.error("--preset cannot be combined with --sweep")
+        if args.split:
+            parser.error("--split cannot be combined with --sweep")
+        overrides = _load_params(args.params) if args.params else {}
+        if args.mastering:
+            overrides["mastering"] = True
+        params_by_name = {name: {**presets.PRESETS[name], **overrides} for name in args.sweep or presets.PRESETS}
+        for name, params in params_by_name.items():
+            _check_params(parser, params, name)
+        failures = sweep_batch(
+            inputs, output_dir, params_by_name, args.workers, profile, args.format, args.decode_cache, args.render_cache
+        )
+    else:
+        if args.preset is None and args.params is None:
+            parser.error("one of --preset, --params or --sweep is required")
+        params = dict(presets.PRESETS[args.preset]) if args.preset else {}
+        if args.params:
+            params.update(_load_params(args.params))
+        if args.mastering:
+            params["mastering"] = True
+        _check_params(parser, params)
+        jobs = [(path, [stems[path].with_name(f"{path.stem}.lofi.{fmt}") for fmt in args.format]) for path in inputs]
+        failures = render_batch(jobs, params, args.workers, profile, args.decode_cache, args.render_cache, args.split)
+    return 1 if failures else 0
+
+
+def render_batch(jobs, params, workers, profile=None, decode_cache=None, render_cache=None, split=None):
+    """Render (input, output) pairs across a process pool; return the failed inputs.
+
+    An output may be a list of paths, one per format. A failing file is
+    reported and skipped without stopping the batch. Unless ``profile`` is
+    None, a per-stage breakdown is printed at the end; True adds peak
+    allocations. ``decode_cache`` and ``render_cache`` are directories (""
+    for the default one) of a DecodeCache to read inputs through and of a
+    RenderCache disk tier to reuse renders from; with a render cache, files
+    are rendered in memory rather than streamed. With ``split``, each file is
+    rendered in memory by parallel.render_parallel on that many processes,
+    without the render cache.
+    """
+    tasks = [
+        (src, (str(src), _output_paths(dst), params, profile, decode_cache, render_cache, split)) for src, dst in jobs
+    ]
+    return _run_pool(_render_one, tasks, workers)
+
+
+def sweep_batch(
+    inputs, output_dir, params_by_name, workers, profile=None, formats=("wav",), decode_cache=None, render_cache=None
+):
+    """Render each input through every params set via dsp.render_sweep; return the failed inputs.
+
+    Each input is decoded once and stage prefixes shared between the params
+    sets are computed once. Outputs are named ``<stem>.<name>.lofi.<format>``,
+    in the input's subdirectory (see _output_stems), which must exist.
+    """
+    stems = _output_stems(inputs, Path(output_dir))
+    tasks = [
+        (src, (str(src), str(stems[src].parent), params_by_name, profile, list(formats), decode_cache, render_cache))
+        for src in inputs
+    ]
+    return _run_pool(_sweep_one, tasks, workers)
+
+
+def _run_pool(fn, tasks, workers):
+    """Run ``fn(*args)`` for each (source, args) task, reporting progress and throughput.
+
+    ``fn`` returns (audio seconds, elapsed seconds, detail, stage profile or None).
+    """
+    started = time.perf_counter()
+    audio_seconds = 0.0
+    failures = []
+    profiler = StageProfiler()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fn, *args): src for src, args in tasks}
+        for done, future in enumerate(as_completed(futures), start=1):
+            src = futures[future]
+            prefix = f"[{done}/{len(tasks)}] {src.name}"
+            try:
+                duration, elapsed, detail, stages = future.result()
+            except Exception as exc:
+                failures.append(src)
+                print(f"{prefix}: FAILED ({exc})", file=sys.stderr)
+                continue
+            audio_seconds += duration
+            if stages is not None:
+                profiler.merge(stages)
+            print(f"{prefix} -> {detail} ({duration:.1f}s audio in {elapsed:.1f}s)")
+
+    wall = time.perf_counter() - started
+    rendered = len(tasks) - len(failures)
+    print(
+        f"Rendered {rendered}/{len(tasks)} files ({len(failures)} failed): "
+        f"{audio_seconds:.1f}s of audio in {wall:.1f}s "
+        f"({audio_seconds / wall if wall else 0.0:.2f} audio-s per wall-s)"
+    )
+    if profiler.stages:
+        print(profiler.report())
+    return failures
+
+
+def _render_one(input_path, output_paths, params, profile=None, decode_cache=None, render_cache=None, split=None):
+    started = time.perf_counter()
+    sr, _, frames = audio_info(input_path)
+    profiler = None if profile is None else StageProfiler(trace_memory=profile)
+    cache = _decode_cache(decode_cache)
+    if render_cache is None and not split:
+        stream_pipeline(input_path, output_paths, _plan(sr, params), observer=profiler, decode_cache=cache)
+    else:
+        audio, sr = _load(input_path, dsp.processing_dtype(params), cache)
+        # Segmented renders differ from serial ones by float rounding, so they are kept out of the cache
+        renders = None if render_cache is None or split else _render_cache(render_cache)
+        key = None if renders is None else renders.key(audio, sr, params)
+        processed = None if renders is None else renders.get(key)
+        if processed is None:
+            if split:
+                processed = render_parallel(audio, sr, params, split, observer=profiler)
+            else:
+                processed = _plan(sr, params).apply(audio, observer=profiler)
+            if renders is not None:
+                renders.put(key, processed)
+        save_audio(output_paths, processed, sr)
+    stages = None if profiler is None else profiler.stages
+    return frames / sr, time.perf_counter() - started, ", ".join(output_paths), stages
+
+
+def _sweep_one(
+    input_path, output_dir, params_by_name, profile=None, formats=("wav",), decode_cache=None, render_cache=None
+):
+    started = time.perf_counter()
+    # Decode at the highest precision any of the params sets processes in
+    dtype = max((dsp.processing_dtype(params) for params in params_by_name.values()), key=lambda d: d.itemsize)
+    audio, sr = _load(input_path, dtype, _decode_cache(decode_cache))
+    profiler = None if profile is None else StageProfiler(trace_memory=profile)
+
+    # Only params sets without a cached render go through the sweep
+    cache = None if render_cache is None else _render_cache(render_cache)
+    keys, cached = {}, {}
+    if cache is not None:
+        for name, params in params_by_name.items():
+            keys[name] = cache.key(audio, sr, params)
+            processed = cache.get(keys[name])
+            if processed is not None:
+                cached[name] = processed
+    pending = {name: params for name, params in params_by_name.items() if name not in cached}
+    outputs, stats = dsp.render_sweep(audio, sr, pending, observer=profiler)
+    if cache is not None:
+        for name, processed in outputs.items():
+            cache.put(keys[name], processed)
+
+    stem = Path(input_path).stem
+    for name, processed in {**cached, **outputs}.items():
+        slug = "-".join(name.lower().split())
+        save_audio([str(Path(output_dir) / f"{stem}.{slug}.lofi.{fmt}") for fmt in formats], processed, sr)
+    detail = (
+        f"{len(outputs)} renders, {stats['evaluations']}/{stats['naive']} stage evaluations "
+        f"({stats['saved']} saved)"
+    )
+    if cached:
+        detail += f", {len(cached)} from the render cache"
+    return audio.shape[0] / sr, time.perf_counter() - started, detail, None if profiler is None else profiler.stages
+
+
+def _plan(sr, params):
+    """PipelinePlan for ``params`` at ``sr``, built once per worker process and reused for every file."""
+    return _cached_plan(sr, json.dumps(params, sort_keys=True))
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_plan(sr, params_json):
+    return dsp.PipelinePlan(sr, json.loads(params_json))
+
+
+def _check_params(parser, params, name=None):
+    try:
+        dsp.check_params(params)
+    except ValueError as exc:
+        parser.error(f"{name}: {exc}" if name else str(exc))
+
+
+def _load(input_path, dtype, decode_cache):
+    return load_audio(input_path, dtype) if decode_cache is None else decode_cache.load(input_path, dtype)
+
+
+def _render_cache(directory):
+    """Disk-only RenderCache for a --render-cache value ("" is the default location)."""
+    return RenderCache(max_bytes=0, directory=directory or default_render_directory())
+
+
+def _decode_cache(directory):
+    """DecodeCache for a --decode-cache value: None is off, "" the default location."""
+    return None if directory is None else DecodeCache(directory or None)
+
+
+def _output_paths(dst):
+    return [str(dst)] if isinstance(dst, (str, os.PathLike)) else [str(path) for path in dst]
+
+
+def _load_params(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _expand_inputs(patterns):
+    """(input files, explicit paths that do not exist); glob patterns that match nothing are not errors."""
+    paths, missing = [], []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) or ([pattern] if os.path.exists(pattern) else [])
+        if not matches and glob.escape(pattern) == pattern:
+            missing.append(pattern)
+        paths.extend(Path(match) for match in matches if os.path.isfile(match))
+    return sorted(set(paths)), missing
+
+
+def _output_stems(inputs, output_dir):
+    """Map each input to its output path without extension, mirroring the inputs' folders under ``output_dir``.
+
+    Paths are taken relative to the deepest folder all inputs share, so
+    ``albums/a/x.mp3`` and ``albums/b/x.mp3`` render to ``a/x`` and ``b/x``.
+    """
+    folders = [os.path.abspath(path.parent) for path in inputs]
+    root = os.path.commonpath(folders) if folders else ""
+    return {path: output_dir / os.path.relpath(folder, root) / path.stem for path, folder in zip(inputs, folders)}
+
+
+def _clashes(stems):
+    """Groups of inputs that map to the same output stem (say ``x.wav`` and ``x.mp3`` in one folder)."""
+    by_stem = {}
+    for path, stem in stems.items():
+        by_stem.setdefault(os.path.normcase(os.path.normpath(stem)), []).append(path)
+    return [paths for paths in by_stem.values() if len(paths) > 1]
+
+
+def _positive_int(text):
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {text!r}") from None
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+if __name__ == "__main__":
+    sys.exit(main())
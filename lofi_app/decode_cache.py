@@ -0,0 +1,239 @@
+"""On-disk cache of decoded source audio: ``python -m lofi_app.decode_cache {info,list,prune,clear}``.
+
+Decoding MP3/OGG/FLAC is a large share of a render when the same sources
+are iterated on. Decoded PCM is stored as ``.npy`` files named after the
+source's content hash, the sample type and the sample rate, and loaded back
+as read-only memory maps. Least recently used entries are evicted once the
+directory grows past its size limit. Uncompressed WAVs are memory-mapped
+directly by io, so they are never cached.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from lofi_app import io
+
+DEFAULT_MAX_BYTES = 4 << 30
+_HASH_CHUNK = 1 << 20
+
+
+def default_directory():
+    """``$LOFI_DECODE_CACHE``, else ``lofi-music/decoded`` under the user cache directory."""
+    if os.environ.get("LOFI_DECODE_CACHE"):
+        return Path(os.environ["LOFI_DECODE_CACHE"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "lofi-music" / "decoded"
+
+
+class NpyStore:
+    """Directory of ``.npy`` entries kept under ``max_bytes`` by evicting the least recently used.
+
+    Several processes may share a directory: entries are written to a
+    temporary file and renamed into place, and readers treat an entry that
+    vanishes under them as a miss.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def open(self, name):
+        """Read-only memory map of entry ``name``, marked as recently used; None if it is missing."""
+        entry = self.directory / name
+        try:
+            array = np.load(entry, mmap_mode="r")
+            # Touch it so eviction sees it as recently used
+            os.utime(entry)
+        except (OSError, ValueError):
+            return None
+        return array
+
+    def save(self, name, array):
+        """Store ``array`` as entry ``name`` and evict old entries to make room."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                np.save(handle, array)
+            os.replace(tmp, self.directory / name)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.prune()
+
+    def entries(self):
+        """(path, bytes, last used time) for every entry, least recently used first."""
+        entries = []
+        for entry in self.directory.glob("*.npy"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((entry, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda item: item[2])
+
+    def prune(self, max_bytes=None):
+        """Evict least recently used entries until the cache fits ``max_bytes``; return (files, bytes) removed."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = freed = 0
+        for entry, size, _ in entries:
+            if total <= limit:
+                break
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Mapped by a process on a platform that forbids deleting open files
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def clear(self):
+        return self.prune(0)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+class DecodeCache(NpyStore):
+    """Decoded audio keyed by source content, kept under ``max_bytes`` on disk.
+
+    A file evicted by another process sharing the directory is simply
+    decoded again.
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        super().__init__(directory if directory is not None else default_directory(), max_bytes)
+
+    def load(self, path, dtype=io.DEFAULT_DTYPE):
+        """Like io.load_audio: ``(audio, sr)``, served from the cache when this content was decoded before."""
+        if io.memmap_audio(path) is not None:
+            return io.load_audio(path, dtype, mmap=True)
+        prefix = f"{content_hash(path)}.{np.dtype(dtype).name}."
+        for entry in self.directory.glob(prefix + "*.npy"):
+            audio = self.open(entry.name)
+            if audio is None:
+                continue
+            self.hits += 1
+            return audio, int(entry.name[len(prefix) : -len(".npy")])
+        self.misses += 1
+        entry = self._store(path, dtype, prefix)
+        audio = np.load(entry, mmap_mode="r")
+        # After mapping it, so an entry larger than the whole cache still serves this load
+        self.prune()
+        return audio, int(entry.name[len(prefix) : -len(".npy")])
+
+    def _store(self, path, dtype, prefix):
+        """Decode ``path`` into a new entry and return its path."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        sr, channels, frames = io.audio_info(path)
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            _decode_into(path, tmp, dtype, channels, frames)
+            entry = self.directory / f"{prefix}{sr}.npy"
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return entry
+
+
+def content_hash(path):
+    """Hex digest of the file's bytes; renamed or copied files share cache entries."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        while chunk := handle.read(_HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _decode_into(path, target, dtype, channels, frames):
+    """Decode ``path`` block by block into a ``.npy`` file at ``target``."""
+    out = np.lib.format.open_memmap(target, mode="w+", dtype=dtype, shape=(frames, channels))
+    written = 0
+    for block in io.read_blocks(path, dtype=dtype, reuse=True):
+        if written + len(block) > frames:
+            break
+        out[written : written + len(block)] = block
+        written += len(block)
+    else:
+        if written == frames:
+            out.flush()
+            return
+    # The header's frame count was off (possible for some MP3s): decode it whole instead.
+    # Through a handle, since np.save would add ".npy" to the temporary file's name.
+    del out
+    audio, _ = io.load_audio(path, dtype)
+    with open(target, "wb") as handle:
+        np.save(handle, audio)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lofi-decode-cache", description="Inspect or prune the decode cache.")
+    parser.add_argument("--dir", help=f"Cache directory (default: {default_directory()})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("info", help="Show size and entry count")
+    commands.add_parser("list", help="List entries, least recently used first")
+    prune = commands.add_parser("prune", help="Evict least recently used entries")
+    prune.add_argument("--max-size", default="4G", help="Size to shrink the cache to, e.g. 500M or 2G")
+    commands.add_parser("clear", help="Remove every entry")
+    args = parser.parse_args(argv)
+
+    cache = DecodeCache(args.dir)
+    if args.command == "info":
+        stats = cache.stats()
+        print(f"{cache.directory}: {stats['entries']} entries, {_format_size(stats['bytes'])}")
+    elif args.command == "list":
+        for entry, size, used in cache.entries():
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  {_format_size(size):>9}  {entry.name}")
+    else:
+        try:
+            limit = 0 if args.command == "clear" else _parse_size(args.max_size)
+        except ValueError:
+            parser.error(f"invalid size: {args.max_size}")
+        removed, freed = cache.prune(limit)
+        print(f"Removed {removed} entries ({_format_size(freed)})")
+    return 0
+
+
+def _parse_size(text):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper()
+    if text.endswith("B"):
+        text = text[:-1]
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+if __name__ == "__main__":
+    sys.exit(main())
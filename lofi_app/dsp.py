@@ -1,62 +1,565 @@
+import copy
+import functools
+import hashlib
 import math
+import numbers
+import threading
+import warnings
+from collections import OrderedDict
+from fractions import Fraction
 
 import librosa
 import numpy as np
-from scipy.signal import butter, fftconvolve, lfilter
-
-
-def apply_pipeline(audio, sr, params):
-    processed = audio.copy()
-
-    processed = _time_stretch(processed, params.get("time_stretch", 1.0))
-    processed = _pitch_shift(processed, sr, params.get("pitch_shift", 0.0))
-    processed = _highpass(processed, sr, params.get("highpass_hz", 30))
-    processed = _lowpass(processed, sr, params.get("lowpass_hz", 14000))
-    processed = _low_shelf(processed, sr, 200, params.get("bass_db", 0.0))
-    processed = _high_shelf(processed, sr, params.get("highshelf_freq", 10000), params.get("highshelf_db", 0.0))
-    processed = _saturate(processed, params.get("saturation", 0.0))
-    processed = _compress(processed, params.get("compression", 0.0))
-    processed = _bitcrush(processed, sr, params.get("bitcrush", 0.0))
-    processed = _wow_flutter(processed, sr, params.get("wow_flutter", 0.0))
-    processed = _stereo_width(processed, params.get("stereo_width", 1.0))
-    processed = _noise(processed, params.get("noise", 0.0))
-    processed = _reverb(processed, sr, params.get("reverb", 0.0))
-    processed = _limit(processed, params.get("limiter", 0.95))
-
+from scipy.signal import butter, firwin, resample_poly, sosfilt
+
+from lofi_app import noise, profiling, reverb
+
+
+# Lowest and highest value of each numeric parameter the stages support; None is unbounded
+_PARAM_RANGES = {
+    "saturation": (0.0, None),
+    "compression": (0.0, None),
+    "bitcrush": (0.0, 1.0),
+    "wow_flutter": (0.0, None),
+    "stereo_width": (0.0, None),
+    "noise": (0.0, None),
+    "noise_bed": (0.0, None),
+    "reverb": (0.0, 1.0),
+    "limiter": (0.0, None),
+    "highpass_hz": (0.0, None),
+}
+# Parameters that must be above zero, with their defaults
+_POSITIVE_PARAMS = {"varispeed": 1.0, "time_stretch": 1.0, "lowpass_hz": 14000, "highshelf_freq": 10000}
+
+# Processing precision. float32 halves memory and bandwidth and is well below
+# the noise floor of the effects; "mastering": True in params selects float64.
+DEFAULT_DTYPE = np.float32
+MASTERING_DTYPE = np.float64
+
+
+def processing_dtype(params):
+    """The dtype every stage keeps the audio in for these params."""
+    return np.dtype(MASTERING_DTYPE if params.get("mastering", False) else DEFAULT_DTYPE)
+
+
+def apply_pipeline(audio, sr, params, cache=None, progress=None, observer=None, offset=0):
+    """Run every stage over ``audio`` in processing_dtype(params).
+
+    With a StageCache, the longest already-computed stage prefix for this
+    input is reused and only the stages after it are run. ``progress(done,
+    total, stage_name)`` is called after each stage; an exception raised from
+    it aborts the render between stages. ``observer`` receives each stage's
+    timing and allocation record (see lofi_app.profiling). ``offset`` is where
+    ``audio`` starts in a longer render, in output frames: the wow/flutter LFO,
+    the bitcrush hold grid and the noise continue from there, as when
+    rendering a file in segments.
+
+    To render many inputs with the same params, build a PipelinePlan once.
+    """
+    stages = _pipeline_stages(sr, params, offset)
+    with profiling.tracing(observer):
+        if cache is not None:
+            return cache.run(audio, sr, stages, progress, observer)
+        return _run_stages(audio, stages, progress, observer)
+
+
+def _run_stages(audio, stages, progress=None, observer=None):
+    """Run (name, function, args) stages over ``audio`` for apply_pipeline and PipelinePlan.apply."""
+    # The dtype stage copies, so from then on the working buffer is ours to
+    # overwrite: length-preserving stages run in place or ping-pong between it
+    # and one spare buffer instead of allocating a new array each.
+    processed = audio
+    spare = None
+    for done, (name, fn, args) in enumerate(stages, start=1):
+        if processed is audio:
+            run = functools.partial(fn, processed, *args)
+        elif fn in _IN_PLACE:
+            run = functools.partial(_IN_PLACE[fn], processed, *args)
+        elif fn in _PING_PONG:
+            if spare is None or spare.shape != processed.shape:
+                spare = np.empty_like(processed)
+            run = functools.partial(_PING_PONG[fn], processed, spare, *args)
+        else:
+            run = functools.partial(fn, processed, *args)
+        out = run() if observer is None else profiling.observe(observer, name, processed, run)
+        if out is spare:
+            processed, spare = spare, processed
+        else:
+            processed = out
+        if progress is not None:
+            progress(done, len(stages), name)
     return processed
 
 
+class PipelinePlan:
+    """apply_pipeline's stages for one params set and sample rate, prepared once for many inputs.
+
+    Building a plan checks the params (see check_params), leaves out every
+    stage they make neutral and computes what the rest need up front: the
+    EQ filter sections, one period of the wow/flutter delay curve and the
+    reverb impulse spectra or delay network gain. ``apply`` renders exactly
+    like apply_pipeline with the same params. Plans pickle along with what
+    they computed, so worker processes can be handed one ready to use.
+    """
+
+    def __init__(self, sr, params):
+        check_params(params, sr)
+        self.sr = sr
+        self.params = dict(params)
+        self.dtype = processing_dtype(params)
+        self.stages = [("dtype", _as_dtype, (self.dtype.name,))]
+
+        speed = params.get("varispeed", 1.0)
+        if speed != 1.0:
+            self.stages.append(("varispeed", _varispeed, (speed,)))
+        rate, n_steps = params.get("time_stretch", 1.0), params.get("pitch_shift", 0.0)
+        if rate != 1.0 or n_steps != 0.0:
+            self.stages.append(("tempo_pitch", _tempo_pitch, (sr, rate, n_steps)))
+        sos = _eq_sos(sr, *_eq_params(params))
+        if sos is not None:
+            self.stages.append(("eq", _sos_filter, (sos,)))
+        if params.get("saturation", 0.0) > 0.0:
+            self.stages.append(("saturate", _saturate, (params["saturation"],)))
+        if params.get("compression", 0.0) > 0.0:
+            self.stages.append(("compress", _compress, (params["compression"],)))
+        # The offset is appended to these stages' args at apply time
+        if params.get("bitcrush", 0.0) > 0.0:
+            self.stages.append(("bitcrush", _bitcrush, (sr, params["bitcrush"])))
+        if params.get("wow_flutter", 0.0) > 0.0:
+            table = _wow_flutter_table(sr, params["wow_flutter"])
+            self.stages.append(("wow_flutter", _modulated_delay, (table, params.get("wow_flutter_interp", "linear"))))
+        if params.get("stereo_width", 1.0) != 1.0:
+            self.stages.append(("stereo_width", _stereo_width, (params["stereo_width"],)))
+        if params.get("noise", 0.0) > 0.0:
+            noise_args = (params["noise"], params.get("noise_seed", 0), params.get("noise_bed", 0.0))
+            self.stages.append(("noise", _noise, (sr, *noise_args)))
+        if params.get("reverb", 0.0) > 0.0:
+            mode = params.get("reverb_mode", "convolution")
+            design = reverb.design(mode, sr, params["reverb"], self.dtype)
+            self.stages.append(("reverb", _reverb, (sr, params["reverb"], mode, design)))
+        if params.get("limiter", 0.95) > 0.0:
+            self.stages.append(("limit", _limit, (params.get("limiter", 0.95),)))
+
+    def apply(self, audio, progress=None, observer=None, offset=0):
+        """Render ``audio`` (at the plan's sample rate); the arguments are as for apply_pipeline."""
+        stages = [
+            (name, fn, (*args, offset) if fn in _POSITIONED else args) for name, fn, args in self.stages
+        ]
+        with profiling.tracing(observer):
+            return _run_stages(audio, stages, progress, observer)
+
+    def split(self, name):
+        """(head, tail) plans for the stages up to and including ``name`` and for the ones after it.
+
+        Applying the tail to the head's output renders like this plan.
+        """
+        index = [stage for stage, _, _ in self.stages].index(name) + 1
+        head, tail = copy.copy(self), copy.copy(self)
+        head.stages, tail.stages = self.stages[:index], self.stages[index:]
+        return head, tail
+
+    def __repr__(self):
+        return f"PipelinePlan({self.sr} Hz: {', '.join(name for name, _, _ in self.stages)})"
+
+
+def as_plan(sr, params):
+    """``params`` as a PipelinePlan for ``sr``; a plan is returned as is if it is for that rate."""
+    if isinstance(params, PipelinePlan):
+        if params.sr != sr:
+            raise ValueError(f"PipelinePlan is for {params.sr} Hz audio, got {sr} Hz")
+        return params
+    return PipelinePlan(sr, params)
+
+
+def check_params(params, sr=None):
+    """Raise ValueError for the first parameter its stage cannot handle.
+
+    Limits that depend on the sample rate (the highpass cutoff below Nyquist)
+    are only checked when ``sr`` is given. Unknown keys are ignored.
+    """
+    for name in ("pitch_shift", "bass_db", "highshelf_db", *_PARAM_RANGES, *_POSITIVE_PARAMS):
+        value = params.get(name, 0.0)
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number, got {value!r}")
+    for name, default in _POSITIVE_PARAMS.items():
+        value = params.get(name, default)
+        if not value > 0.0:
+            raise ValueError(f"{name} must be positive, got {value}")
+    for name, (lowest, highest) in _PARAM_RANGES.items():
+        value = params.get(name, lowest)
+        if value < lowest or (highest is not None and value > highest):
+            bounds = f"between {lowest:g} and {highest:g}" if highest is not None else f"at least {lowest:g}"
+            raise ValueError(f"{name} must be {bounds}, got {value}")
+    if sr is not None and params.get("highpass_hz", 30) >= sr / 2:
+        raise ValueError(f"highpass_hz must be below half the sample rate ({sr / 2:g} Hz), got {params['highpass_hz']}")
+    if params.get("reverb_mode", "convolution") not in reverb.MODES:
+        raise ValueError(f"Unknown reverb mode: {params['reverb_mode']}")
+    _check_interp(params.get("wow_flutter_interp", "linear"))
+    seed = params.get("noise_seed", 0)
+    if seed is not None and not (isinstance(seed, (int, np.integer)) and seed >= 0):
+        raise ValueError(f"noise_seed must be a non-negative integer or None, got {seed!r}")
+
+
+def render_window(audio, sr, params, start, duration, pre_roll=None):
+    """Render about ``duration`` seconds of output from ``start`` seconds into ``audio``.
+
+    Only the matching input region is processed, plus ``pre_roll`` seconds
+    (default pre_roll_seconds(params)) before it to warm filter state,
+    envelopes and the reverb tail, which are then trimmed away. The phase vocoder's phase accumulation restarts at the
+    region, so with tempo or pitch changes the window sounds like the full
+    render there but is not sample-identical to it.
+    """
+    in_start, in_stop, skip, frames = window_bounds(len(audio), sr, params, start, duration, pre_roll)
+    offset = int(round(in_start * output_scale(params)))
+    return apply_pipeline(audio[in_start:in_stop], sr, params, offset=offset)[skip : skip + frames]
+
+
+def window_bounds(n_frames, sr, params, start, duration, pre_roll=None):
+    """Input slice and output trim for render_window: ``(in_start, in_stop, skip, frames)``.
+
+    Process ``audio[in_start:in_stop]``, drop the first ``skip`` output frames
+    and keep at most ``frames``. ``start`` is in input time and ``duration``
+    in output time; varispeed and tempo change how long the output is.
+    """
+    if pre_roll is None:
+        pre_roll = pre_roll_seconds(params)
+    scale = output_scale(params)
+    first = min(max(int(round(start * sr)), 0), n_frames)
+    in_start = max(first - int(round(pre_roll * sr)), 0)
+    # A little look-ahead for the phase vocoder and resampling filters
+    in_stop = min(first + int(math.ceil((duration + 0.1) * sr / scale)), n_frames)
+    skip = int(round((first - in_start) * scale))
+    return in_start, in_stop, skip, int(round(duration * sr))
+
+
+def output_scale(params):
+    """Output frames per input frame: varispeed and tempo change how long the render is."""
+    return 1.0 / (params.get("varispeed", 1.0) * params.get("time_stretch", 1.0))
+
+
+def pre_roll_seconds(params):
+    """Seconds rendered ahead of a window or segment: enough for the filters and envelopes, plus the reverb tail."""
+    amount = params.get("reverb", 0.0)
+    tail = reverb.tail_seconds(params.get("reverb_mode", "convolution"), amount) if amount > 0.0 else 0.0
+    return 1.0 + tail
+
+
+class ArrayLRU:
+    """Arrays kept in memory under ``max_bytes``, evicting the least recently used.
+
+    The base of StageCache and render_cache.RenderCache. Subclasses hold
+    ``_lock`` around every use of the entries.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._source = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._source = None
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _lookup(self, key):
+        """The entry for ``key``, marked as recently used, or None."""
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def _source_key(self, audio):
+        # Hash each input once; the reference keeps id() from being reused.
+        if self._source is None or self._source[0] is not audio:
+            self._source = (audio, content_hash(audio))
+        return self._source[1]
+
+    def _store(self, key, value):
+        if key in self._entries or value.nbytes > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._bytes += value.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+
+class StageCache(ArrayLRU):
+    """LRU cache of intermediate stage outputs, bounded by ``max_bytes``.
+
+    Entries are keyed on the input's content hash and the full (stage, args)
+    prefix that produced them, so changing a late stage only reruns that stage
+    and the ones after it. Inputs must not be modified in place while cached.
+    Renders from different threads are serialised.
+    """
+
+    def __init__(self, max_bytes=1 << 30):
+        super().__init__(max_bytes)
+
+    def run(self, audio, sr, stages, progress=None, observer=None):
+        with self._lock:
+            return self._run(audio, sr, stages, progress, observer)
+
+    def _run(self, audio, sr, stages, progress, observer):
+        source = (self._source_key(audio), sr)
+        keys = [(source, tuple(stages[: i + 1])) for i in range(len(stages))]
+
+        start, processed = 0, audio
+        for i in range(len(keys) - 1, -1, -1):
+            cached = self._lookup(keys[i])
+            if cached is not None:
+                start, processed = i + 1, cached
+                break
+        self.hits += start
+        if start and progress is not None:
+            progress(start, len(stages), stages[start - 1][0])
+
+        for done, (key, (name, fn, args)) in enumerate(zip(keys[start:], stages[start:]), start=start + 1):
+            if observer is None:
+                out = fn(processed, *args)
+            else:
+                out = profiling.observe(observer, name, processed, functools.partial(fn, processed, *args))
+            self.misses += 1
+            # Stages that pass their input through are free to rerun.
+            if out is not processed:
+                self._store(key, out)
+            processed = out
+            if progress is not None:
+                progress(done, len(stages), name)
+        return processed.copy()
+
+
+def content_hash(audio):
+    """Hex digest of the samples, shape and dtype of ``audio``."""
+    digest = hashlib.blake2b(np.ascontiguousarray(audio).data, digest_size=16)
+    digest.update(repr((audio.shape, audio.dtype.str)).encode())
+    return digest.hexdigest()
+
+
+def render_sweep(audio, sr, params_by_name, observer=None):
+    """Render ``audio`` once per named params dict, sharing common stage prefixes.
+
+    The stage sequences form a tree; each distinct prefix is computed once and
+    work only fans out where parameters diverge. Returns ``(outputs, stats)``
+    where ``outputs`` maps each name to its render (renders of identical
+    sequences are the same array) and ``stats`` counts stage evaluations.
+    ``observer`` sees each evaluation, as in apply_pipeline.
+    """
+    tree = {"children": {}, "names": []}
+    for name, params in params_by_name.items():
+        node = tree
+        for stage in _pipeline_stages(sr, params):
+            node = node["children"].setdefault(stage, {"children": {}, "names": []})
+        node["names"].append(name)
+
+    outputs = {}
+    evaluations = 0
+    pending = [(tree, audio.copy())]
+    with profiling.tracing(observer):
+        while pending:
+            node, processed = pending.pop()
+            for name in node["names"]:
+                outputs[name] = processed
+            for (stage, fn, args), child in node["children"].items():
+                evaluations += 1
+                run = functools.partial(fn, processed, *args)
+                out = run() if observer is None else profiling.observe(observer, stage, processed, run)
+                pending.append((child, out))
+
+    naive = len(params_by_name) * len(_pipeline_stages(sr, {}))
+    stats = {"evaluations": evaluations, "naive": naive, "saved": naive - evaluations}
+    return outputs, stats
+
+
+def _pipeline_stages(sr, params, offset=0):
+    """(name, function, args) for each stage in order; each stage runs as ``function(audio, *args)``."""
+    wow_flutter = (params.get("wow_flutter", 0.0), params.get("wow_flutter_interp", "linear"))
+    noise_args = (params.get("noise", 0.0), params.get("noise_seed", 0), params.get("noise_bed", 0.0))
+    return [
+        ("dtype", _as_dtype, (processing_dtype(params).name,)),
+        ("varispeed", _varispeed, (params.get("varispeed", 1.0),)),
+        ("tempo_pitch", _tempo_pitch, (sr, params.get("time_stretch", 1.0), params.get("pitch_shift", 0.0))),
+        ("eq", _eq, (sr, *_eq_params(params))),
+        ("saturate", _saturate, (params.get("saturation", 0.0),)),
+        ("compress", _compress, (params.get("compression", 0.0),)),
+        ("bitcrush", _bitcrush, (sr, params.get("bitcrush", 0.0), offset)),
+        ("wow_flutter", _wow_flutter, (sr, *wow_flutter, offset)),
+        ("stereo_width", _stereo_width, (params.get("stereo_width", 1.0),)),
+        ("noise", _noise, (sr, *noise_args, offset)),
+        ("reverb", _reverb, (sr, params.get("reverb", 0.0), params.get("reverb_mode", "convolution"))),
+        ("limit", _limit, (params.get("limiter", 0.95),)),
+    ]
+
+
+def _as_dtype(audio, dtype):
+    return audio.astype(dtype)
+
+
+def _eq_params(params):
+    """(highpass_hz, lowpass_hz, bass_db, highshelf_freq, highshelf_db) for _eq."""
+    return (
+        params.get("highpass_hz", 30),
+        params.get("lowpass_hz", 14000),
+        params.get("bass_db", 0.0),
+        params.get("highshelf_freq", 10000),
+        params.get("highshelf_db", 0.0),
+    )
+
+
+def _varispeed(audio, speed):
+    """Tape-style speed change: tempo and pitch move together in one polyphase resample."""
+    if speed == 1.0:
+        return audio
+    up, down = _varispeed_ratio(speed)
+    return resample_poly(audio, up, down, axis=0)
+
+
+def _varispeed_ratio(speed):
+    """Resampling factors (up, down); slowing down (speed < 1) lengthens the audio."""
+    if speed <= 0.0:
+        raise ValueError(f"varispeed must be positive, got {speed}")
+    ratio = Fraction(speed).limit_denominator(1000)
+    return ratio.denominator, ratio.numerator
+
+
+def _varispeed_filter(up, down):
+    """Anti-aliasing FIR used by resample_poly for these factors, and its half length."""
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    return firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0)) * up, half_len
+
+
+# librosa works on the last axis, so (frames, channels) audio is passed
+# transposed: all channels share one batched STFT and come back as a view.
+def _tempo_pitch(audio, sr, rate, n_steps):
+    """Tempo then pitch; fused into one phase-vocoder pass when both are active."""
+    if n_steps != 0.0:
+        return _stretch_and_shift(audio, sr, rate, n_steps)
+    return _time_stretch(audio, rate)
+
+
+def _stretch_and_shift(audio, sr, rate, n_steps):
+    """Single-pass equivalent of a time stretch by ``rate`` followed by a pitch shift.
+
+    Pitch shifting is a stretch by ``pitch_rate`` followed by a resample back
+    to the original duration, so both stretches collapse into one phase
+    vocoder run at ``rate * pitch_rate`` and a single resample.
+    """
+    pitch_rate = 2.0 ** (-float(n_steps) / 12)
+    length = int(round(audio.shape[0] / rate))
+    stretched = librosa.effects.time_stretch(audio.T, rate=rate * pitch_rate)
+    shifted = librosa.resample(stretched, orig_sr=float(sr) / pitch_rate, target_sr=sr, res_type="soxr_hq")
+    return librosa.util.fix_length(shifted, size=length).T
+
+
 def _time_stretch(audio, rate):
     if rate == 1.0:
         return audio
-    return _apply_per_channel(audio, lambda ch: librosa.effects.time_stretch(ch, rate=rate))
+    return librosa.effects.time_stretch(audio.T, rate=rate).T
+
+
+def _eq(audio, sr, highpass_hz, lowpass_hz, bass_db, highshelf_freq, highshelf_db):
+    """Highpass, lowpass, bass shelf and treble shelf as one second-order-sections pass."""
+    return _sos_filter(audio, _eq_sos(sr, highpass_hz, lowpass_hz, bass_db, highshelf_freq, highshelf_db))
 
 
-def _pitch_shift(audio, sr, n_steps):
-    if n_steps == 0.0:
+def _eq_inplace(buf, sr, highpass_hz, lowpass_hz, bass_db, highshelf_freq, highshelf_db):
+    return _sos_filter_inplace(buf, _eq_sos(sr, highpass_hz, lowpass_hz, bass_db, highshelf_freq, highshelf_db))
+
+
+def _sos_filter(audio, sos):
+    if sos is None:
         return audio
-    return _apply_per_channel(
-        audio, lambda ch: librosa.effects.pitch_shift(ch, sr=sr, n_steps=n_steps)
-    )
+    if audio.dtype == np.float64 and len(audio):
+        return sosfilt(sos, audio, axis=0)
+    return _sosfilt_blocks(sos, audio, np.empty_like(audio))
+
+
+def _sos_filter_inplace(buf, sos):
+    if sos is None:
+        return buf
+    return _sosfilt_blocks(sos, buf, buf)
+
 
+def _sosfilt_blocks(sos, audio, out, block_size=65536):
+    """sosfilt into ``out`` (which may be ``audio``) one block at a time.
 
-def _lowpass(audio, sr, cutoff_hz):
+    State and coefficients stay float64: low cutoffs put poles close to the
+    unit circle, where float32 would cost ~80 dB of SNR.
+    """
+    zi = np.zeros((len(sos), 2, audio.shape[1]))
+    for start in range(0, len(audio), block_size):
+        block, zi = sosfilt(sos, audio[start : start + block_size], axis=0, zi=zi)
+        out[start : start + block_size] = block
+    return out
+
+
+@functools.lru_cache(maxsize=256)
+def _eq_sos(sr, highpass_hz, lowpass_hz, bass_db, highshelf_freq, highshelf_db):
+    """SOS cascade for the EQ section, or None when every band is neutral.
+
+    Memoized per (sr, params), so repeated renders and batch jobs design each
+    filter once; the returned array is shared, so do not modify it.
+    """
+    sections = [
+        sos
+        for sos in (
+            _highpass_sos(sr, highpass_hz),
+            _lowpass_sos(sr, lowpass_hz),
+            _low_shelf_sos(sr, 200, bass_db),
+            _high_shelf_sos(sr, highshelf_freq, highshelf_db),
+        )
+        if sos is not None
+    ]
+    if not sections:
+        return None
+    return np.concatenate(sections)
+
+
+def _lowpass_sos(sr, cutoff_hz):
     if cutoff_hz >= (sr / 2.0):
-        return audio
-    b, a = butter(4, cutoff_hz / (sr / 2.0), btype="low")
-    return lfilter(b, a, audio, axis=0)
+        return None
+    return butter(4, cutoff_hz / (sr / 2.0), btype="low", output="sos")
 
 
-def _highpass(audio, sr, cutoff_hz):
+def _highpass_sos(sr, cutoff_hz):
+    # Transfer-function form loses precision at low cutoffs like 30 Hz; sections do not
     if cutoff_hz <= 0.0:
-        return audio
-    b, a = butter(4, cutoff_hz / (sr / 2.0), btype="high")
-    return lfilter(b, a, audio, axis=0)
+        return None
+    return butter(4, cutoff_hz / (sr / 2.0), btype="high", output="sos")
+
 
+def _low_shelf_sos(sr, freq, gain_db):
+    coeffs = _low_shelf_coeffs(sr, freq, gain_db)
+    return None if coeffs is None else np.concatenate(coeffs)[np.newaxis]
 
-def _low_shelf(audio, sr, freq, gain_db):
+
+def _high_shelf_sos(sr, freq, gain_db):
+    """High-shelf biquad for treble roll-off (vintage tape characteristic)"""
+    coeffs = _high_shelf_coeffs(sr, freq, gain_db)
+    return None if coeffs is None else np.concatenate(coeffs)[np.newaxis]
+
+
+def _low_shelf_coeffs(sr, freq, gain_db):
     if gain_db == 0.0:
-        return audio
+        return None
 
     a = 10 ** (gain_db / 40.0)
     w0 = 2 * math.pi * freq / sr
@@ -73,13 +576,13 @@ def _low_shelf(audio, sr, freq, gain_db):
 
     b = np.array([b0, b1, b2]) / a0
     a = np.array([1.0, a1 / a0, a2 / a0])
-    return lfilter(b, a, audio, axis=0)
+    return b, a
 
 
-def _high_shelf(audio, sr, freq, gain_db):
-    """High-shelf filter for treble roll-off (vintage tape characteristic)"""
-    if gain_db == 0.0:
-        return audio
+def _high_shelf_coeffs(sr, freq, gain_db):
+    # Nothing to shape at or above Nyquist, and the biquad would be unstable there
+    if gain_db == 0.0 or freq >= sr / 2:
+        return None
 
     a = 10 ** (gain_db / 40.0)
     w0 = 2 * math.pi * freq / sr
@@ -96,72 +599,247 @@ def _high_shelf(audio, sr, freq, gain_db):
 
     b = np.array([b0, b1, b2]) / a0
     a = np.array([1.0, a1 / a0, a2 / a0])
-    return lfilter(b, a, audio, axis=0)
+    return b, a
 
 
 def _saturate(audio, amount):
     if amount <= 0.0:
         return audio
     drive = 1.0 + amount * 4.0
-    return np.tanh(audio * drive) / np.tanh(drive)
+    return np.tanh(audio * drive) / math.tanh(drive)
 
 
-def _bitcrush(audio, sr, amount):
+def _saturate_inplace(buf, amount):
+    if amount <= 0.0:
+        return buf
+    drive = 1.0 + amount * 4.0
+    buf *= drive
+    np.tanh(buf, out=buf)
+    buf /= math.tanh(drive)
+    return buf
+
+
+def _bitcrush(audio, sr, amount, offset=0):
     """Simulate lo-fi digital artifacts with bit depth and sample rate reduction"""
     if amount <= 0.0:
         return audio
     
-    # Bit depth reduction
-    bits = 16 - int(amount * 12)  # 16-bit down to 4-bit
-    levels = 2 ** bits
-    crushed = np.round(audio * levels) / levels
+    crushed = _reduce_bits(audio, amount)
     
     # Sample rate reduction (simulate old samplers)
-    if amount > 0.3:
-        downsample_factor = 1 + int(amount * 8)
-        crushed = crushed[::downsample_factor]
+    downsample_factor = _downsample_factor(amount)
+    if downsample_factor > 1:
+        # Hold groups are aligned to the full render; a group cut by the start holds its first sample
+        head = -offset % downsample_factor
+        crushed[:head] = crushed[:1]
+        held = crushed[head::downsample_factor]
         # Upsample back (with aliasing artifacts)
-        crushed = np.repeat(crushed, downsample_factor, axis=0)
+        held = np.repeat(held, downsample_factor, axis=0)
         # Trim to original length
-        if len(crushed) > len(audio):
-            crushed = crushed[:len(audio)]
-        elif len(crushed) < len(audio):
-            pad = np.zeros((len(audio) - len(crushed), audio.shape[1]))
-            crushed = np.vstack([crushed, pad])
+        crushed[head:] = held[: len(audio) - head]
     
     return crushed
 
 
-def _compress(audio, amount):
+def _bitcrush_inplace(buf, sr, amount, offset=0):
     if amount <= 0.0:
+        return buf
+    levels = 2 ** (16 - int(amount * 12))
+    buf *= levels
+    np.round(buf, out=buf)
+    buf /= levels
+
+    # Sample-and-hold: every sample takes the value at the start of its group
+    factor = _downsample_factor(amount)
+    if factor > 1:
+        head = -offset % factor
+        buf[:head] = buf[:1]
+        _hold_groups(buf[head:], factor)
+    return buf
+
+
+def _hold_groups(buf, factor):
+    """Sample-and-hold ``buf`` in place in groups of ``factor`` starting at its first sample."""
+    whole = len(buf) // factor * factor
+    step = 65536 // factor * factor
+    for start in range(0, whole, step):
+        groups = buf[start : min(start + step, whole)].reshape(-1, factor, buf.shape[1])
+        groups[:, 1:] = groups[:, :1]
+    buf[whole:] = buf[whole : whole + 1]
+    return buf
+
+
+def _reduce_bits(audio, amount):
+    bits = 16 - int(amount * 12)  # 16-bit down to 4-bit
+    levels = 2 ** bits
+    return np.round(audio * levels) / levels
+
+
+def _downsample_factor(amount):
+    if amount > 0.3:
+        return 1 + int(amount * 8)
+    return 1
+
+
+def _compress(audio, amount):
+    """Peak compressor, vectorized equivalent of the per-sample envelope/gain loop.
+
+    Matches the reference recursion to within 1e-5 absolute on full-scale input.
+    """
+    if amount <= 0.0 or not len(audio):
         return audio
+    peak = np.abs(audio).max(axis=1).astype(np.float64)
+    peak[0] = 0.0
+    _, gain = _compressor_gain(peak, amount)
+    return audio * gain[:, None].astype(audio.dtype)
+
+
+def _compress_inplace(buf, amount, block_size=65536):
+    """_compress one block at a time, carrying envelope and gain between blocks."""
+    if amount <= 0.0:
+        return buf
+    env, gain = 0.0, 1.0
+    for start in range(0, len(buf), block_size):
+        block = buf[start : start + block_size]
+        peak = np.abs(block).max(axis=1).astype(np.float64)
+        if start == 0:
+            peak[0] = 0.0
+        envs, gains = _compressor_gain(peak, amount, env, gain)
+        env, gain = envs[-1], gains[-1]
+        block *= gains[:, None].astype(block.dtype)
+    return buf
+
+
+def _compressor_gain(peak, amount, env0=0.0, gain0=1.0):
+    """Envelope and gain curves for per-frame peaks, continuing from (env0, gain0)."""
     threshold = 0.5
     ratio = 1.0 + amount * 4.0
     attack = 0.01
     release = 0.1
 
-    env = np.zeros(audio.shape[0], dtype=np.float32)
-    gain = np.ones_like(env)
-    for i in range(1, len(env)):
-        env[i] = max(abs(audio[i]).max(), env[i - 1] * (1 - release))
-        target = 1.0
-        if env[i] > threshold:
-            target = (threshold + (env[i] - threshold) / ratio) / env[i]
-        coeff = attack if target < gain[i - 1] else release
-        gain[i] = gain[i - 1] + coeff * (target - gain[i - 1])
-    return audio * gain[:, None]
+    env = _peak_envelope(peak, release, env0)
+
+    target = np.ones_like(env)
+    over = env > threshold
+    target[over] = (threshold + (env[over] - threshold) / ratio) / env[over]
+
+    gain = _smooth_gain(target, attack, release, gain0)
+    return env, gain
+
+
+def _peak_envelope(peak, release, initial=0.0, block_size=4096):
+    """Solve env[i] = max(peak[i], env[i - 1] * (1 - release)) with running maxima.
+
+    In the log domain the decaying hold becomes a cumulative max of
+    ``log(peak[k]) - k * log(1 - release)``; blocks keep the offsets small.
+    """
+    log_decay = math.log1p(-release)
+    env = np.empty_like(peak)
+    offsets = np.arange(block_size) * log_decay
+    with np.errstate(divide="ignore"):
+        log_peak = np.log(peak)
+    carry = math.log(initial) if initial > 0.0 else -np.inf
+    for start in range(0, len(peak), block_size):
+        seg = log_peak[start:start + block_size]
+        k = offsets[: len(seg)]
+        held = np.maximum.accumulate(seg - k) + k
+        held = np.maximum(held, carry + k + log_decay)
+        env[start:start + len(seg)] = np.exp(held)
+        carry = held[-1]
+    return env
+
+
+def _smooth_gain(target, attack, release, initial=1.0, tol=1e-7, max_iter=32):
+    """Asymmetric one-pole gain smoother continuing from ``initial``.
+
+    The attack/release choice depends on the previous output, so the
+    coefficients are refined by fixed-point iteration; each pass solves the
+    resulting linear recursion in closed form. Warns with a RuntimeWarning if
+    the iteration has not converged after ``max_iter`` passes.
+    """
+    # Below threshold the target is unity and gain can only rise (release).
+    coeff = np.full(target.shape, release)
+    gain = _one_pole_varying(coeff, target, initial)
+    change = np.inf
+    for _ in range(max_iter):
+        previous = np.empty_like(gain)
+        previous[0] = initial
+        previous[1:] = gain[:-1]
+        coeff = np.where(target < previous, attack, release)
+        updated = _one_pole_varying(coeff, target, initial)
+        change = np.max(np.abs(updated - gain))
+        gain = updated
+        if change < tol:
+            return gain
+    warnings.warn(
+        f"compressor gain did not converge in {max_iter} passes (last change {change:.2g})",
+        RuntimeWarning,
+        stacklevel=2,
+    )
+    return gain
+
+
+def _one_pole_varying(coeff, x, y0, block_size=64):
+    """Solve y[i] = y[i - 1] + coeff[i] * (x[i] - y[i - 1]) for time-varying coeff."""
+    n = len(x)
+    n_blocks = -(-n // block_size)
+    pad = n_blocks * block_size - n
+    decay = np.pad(1.0 - coeff, (0, pad), constant_values=1.0).reshape(n_blocks, block_size)
+    drive = np.pad(coeff * x, (0, pad)).reshape(n_blocks, block_size)
+
+    # Zero-state response inside each block, then chain the block boundaries.
+    decay = np.cumprod(decay, axis=1)
+    local = decay * np.cumsum(drive / decay, axis=1)
+    starts = np.empty(n_blocks)
+    state = y0
+    for b, (block_decay, block_end) in enumerate(zip(decay[:, -1].tolist(), local[:, -1].tolist())):
+        starts[b] = state
+        state = block_decay * state + block_end
+    return (local + decay * starts[:, None]).reshape(-1)[:n]
 
 
-def _wow_flutter(audio, sr, amount):
+def _wow_flutter(audio, sr, amount, interp="linear", offset=0):
     if amount <= 0.0:
         return audio
+    return _modulated_delay(audio, _wow_flutter_table(sr, amount), interp, offset)
+
+
+def _wow_flutter_into(src, dst, sr, amount, interp="linear", offset=0, block_size=65536):
+    """_wow_flutter writing into ``dst``."""
+    if amount <= 0.0:
+        return src
+    return _modulated_delay_into(src, dst, _wow_flutter_table(sr, amount), interp, offset, block_size)
+
+
+def _modulated_delay(audio, table, interp="linear", offset=0):
+    """Delay frame i of ``audio`` by ``table[(offset + i) % len(table)]`` samples."""
+    positions = np.arange(audio.shape[0]) + offset
+    return _fractional_delay(audio, np.take(table, positions, mode="wrap"), interp)
+
+
+def _modulated_delay_into(src, dst, table, interp="linear", offset=0, block_size=65536):
+    """_modulated_delay writing into ``dst``, looking the delay up one block at a time."""
+    _check_interp(interp)
+    for start in range(0, len(src), block_size):
+        positions = np.arange(start, min(start + block_size, len(src))) + offset
+        _delay_block(src, dst, start, np.take(table, positions, mode="wrap"), interp)
+    return dst
+
+
+@functools.lru_cache(maxsize=32)
+def _wow_flutter_table(sr, amount):
+    """Modulated delay in samples over one 2 s LFO period, indexed by sample position.
+
+    Shared between calls, so do not modify it.
+    """
     depth = 0.003 * amount
     # Multiple modulation frequencies for more realistic tape mechanics
-    t = np.arange(audio.shape[0]) / sr
+    t = np.arange(2 * sr) / sr
     slow_mod = depth * np.sin(2 * math.pi * 0.5 * t)  # 0.5 Hz slow wow
     fast_mod = (depth * 0.3) * np.sin(2 * math.pi * 5.0 * t)  # 5 Hz fast flutter
-    mod = slow_mod + fast_mod
-    return _fractional_delay(audio, mod * sr)
+    table = (slow_mod + fast_mod) * sr
+    table.flags.writeable = False
+    return table
 
 
 def _stereo_width(audio, width):
@@ -183,61 +861,67 @@ def _stereo_width(audio, width):
     return np.stack([left, right], axis=1)
 
 
-def _noise(audio, amount):
+def _stereo_width_inplace(buf, width, block_size=65536):
+    if width == 1.0 or buf.shape[1] != 2:
+        return _stereo_width(buf, width)
+    for start in range(0, len(buf), block_size):
+        block = buf[start : start + block_size]
+        side = block[:, 0] - block[:, 1]
+        side /= 2
+        side *= width
+        mid = block[:, 0] + block[:, 1]
+        mid /= 2
+        np.add(mid, side, out=block[:, 0])
+        np.subtract(mid, side, out=block[:, 1])
+    return buf
+
+
+def _noise(audio, sr, amount, seed=0, bed_seconds=0.0, offset=0):
     """Enhanced noise with pink noise, vinyl crackle, and tape hiss"""
     if amount <= 0.0:
         return audio
-    
-    output = audio.copy()
-    
-    # Pink noise (more natural than white noise) - reduced intensity
-    pink = _generate_pink_noise(audio.shape)
-    output += pink * amount * 0.004  # Reduced from 0.008
-    
-    # Vinyl crackle (random pops) - only at higher amounts
-    if amount > 0.2:
-        crackle_density = amount * 0.00005  # Reduced from 0.0001
-        crackle = np.random.random(audio.shape) < crackle_density
-        crackle_audio = crackle.astype(float) * np.random.uniform(-0.3, 0.3, audio.shape)
-        output += crackle_audio * amount * 0.5
-    
-    # Tape hiss (filtered white noise) - very subtle
-    if amount > 0.05:
-        hiss = np.random.normal(0.0, 0.003, size=audio.shape)  # Reduced from 0.005
-        output += hiss * amount * 0.5
-    
-    return output
+    bank = noise.NoiseBank(sr, amount, audio.shape[1], seed, audio.dtype, bed_seconds, offset)
+    return audio + bank.next(len(audio))
 
 
-def _generate_pink_noise(shape):
-    """Generate pink noise (1/f noise) for more natural sound"""
-    white = np.random.randn(shape[0], shape[1])
-    # Simple pink noise approximation using multiple octaves
-    pink = np.zeros_like(white)
-    octaves = [1, 2, 4, 8, 16]
-    for octave in octaves:
-        if shape[0] // octave > 0:
-            resampled = np.repeat(np.random.randn(shape[0] // octave, shape[1]), octave, axis=0)
-            pink[:len(resampled)] += resampled[:shape[0]] / octave
-    return pink / len(octaves)
+def _noise_inplace(buf, sr, amount, seed=0, bed_seconds=0.0, offset=0, block_size=65536):
+    """_noise added one block at a time; the bank's output does not depend on the block size."""
+    if amount <= 0.0:
+        return buf
+    bank = noise.NoiseBank(sr, amount, buf.shape[1], seed, buf.dtype, bed_seconds, offset)
+    for start in range(0, len(buf), block_size):
+        block = buf[start : start + block_size]
+        block += bank.next(len(block))
+    return buf
 
 
-def _reverb(audio, sr, amount):
+def _reverb(audio, sr, amount, mode="convolution", design=None):
     if amount <= 0.0:
         return audio
-    decay = 0.3 + 1.2 * amount
-    length = int(sr * 0.4)
-    impulse = np.exp(-np.linspace(0, decay, length))
-    impulse[0] = 1.0
-    wet = np.vstack(
-        [fftconvolve(audio[:, ch], impulse, mode="full")[: audio.shape[0]] for ch in range(audio.shape[1])]
-    ).T
+    engine = reverb.make_engine(mode, sr, amount, audio.shape[1], audio.dtype, design)
+    wet = np.concatenate([engine.process(audio), engine.flush()])
     return (1 - amount) * audio + amount * wet
 
 
+def _reverb_inplace(buf, sr, amount, mode="convolution", design=None, block_size=65536):
+    """_reverb one block at a time, overwriting each block once its wet signal is known."""
+    if amount <= 0.0:
+        return buf
+    engine = reverb.make_engine(mode, sr, amount, buf.shape[1], buf.dtype, design)
+    # Whole blocks are a multiple of the partition size, so only the last one is held back
+    for start in range(0, len(buf), block_size):
+        block = buf[start : start + block_size]
+        wet = engine.process(block)
+        if len(wet) < len(block):
+            wet = np.concatenate([wet, engine.flush()])
+        block *= 1 - amount
+        block += amount * wet
+    return buf
+
+
 def _limit(audio, ceiling):
     """Soft limiter to preserve dynamics"""
-    if ceiling <= 0.0:
+    if ceiling <= 0.0 or not audio.size:
         return audio
     peak = np.max(np.abs(audio))
     if peak <= ceiling:
@@ -247,26 +931,80 @@ def _limit(audio, ceiling):
     return audio * (ratio * 0.95)  # Leave some headroom
 
 
-def _apply_per_channel(audio, fn):
-    channels = []
-    for ch in range(audio.shape[1]):
-        channels.append(fn(audio[:, ch]))
-    min_len = min(len(ch) for ch in channels)
-    stacked = np.stack([ch[:min_len] for ch in channels], axis=1)
-    return stacked
+def _limit_inplace(buf, ceiling, block_size=65536):
+    if ceiling <= 0.0:
+        return buf
+    peak = max((np.abs(buf[i : i + block_size]).max() for i in range(0, len(buf), block_size)), default=0.0)
+    if peak <= ceiling:
+        return buf
+    buf *= (ceiling / peak) * 0.95
+    return buf
+
+
+def _fractional_delay(audio, delay_samples, interp="linear", block_size=65536):
+    """Read audio at ``i - delay_samples[i]``; samples outside the source are silent.
+
+    ``interp`` selects linear or 4-point Lagrange ("cubic") interpolation.
+    Work is done in bounded blocks across all channels at once.
+    """
+    _check_interp(interp)
+    out = np.empty_like(audio)
+    for start in range(0, audio.shape[0], block_size):
+        _delay_block(audio, out, start, delay_samples[start : start + block_size], interp)
+    return out
+
+
+def _check_interp(interp):
+    if interp not in ("linear", "cubic"):
+        raise ValueError(f"Unknown interpolation: {interp}")
 
 
-def _fractional_delay(audio, delay_samples):
-    out = np.zeros_like(audio)
+def _delay_block(audio, out, start, delay, interp):
+    """Fill ``out[start:start + len(delay)]`` for _fractional_delay; ``out`` must not be ``audio``."""
+    stop = start + len(delay)
+    idx = np.arange(start, stop) - delay
+    valid = (idx > 0) & (idx < audio.shape[0] - 1)
+    block = out[start:stop]
+    block[~valid] = 0.0
+    if valid.any():
+        block[valid] = _interpolate(audio, idx[valid], interp)
+
+
+def _interpolate(audio, idx, interp):
+    """Sample ``audio`` at fractional positions ``idx`` (0 < idx < len - 1)."""
     max_index = audio.shape[0] - 1
-    for i in range(audio.shape[0]):
-        idx = i - delay_samples[i]
-        if idx <= 0 or idx >= max_index:
-            continue
-        i0 = int(math.floor(idx))
-        if i0 >= max_index:
-            continue
-        i1 = i0 + 1
-        frac = idx - i0
-        out[i] = (1 - frac) * audio[i0] + frac * audio[i1]
-    return out
+    i0 = np.floor(idx).astype(np.intp)
+    frac = (idx - i0)[:, None]
+    if interp == "linear":
+        return (1 - frac) * audio[i0] + frac * audio[i0 + 1]
+    im1 = np.maximum(i0 - 1, 0)
+    i2 = np.minimum(i0 + 2, max_index)
+    return (
+        -frac * (frac - 1) * (frac - 2) / 6 * audio[im1]
+        + (frac + 1) * (frac - 1) * (frac - 2) / 2 * audio[i0]
+        - (frac + 1) * frac * (frac - 2) / 2 * audio[i0 + 1]
+        + (frac + 1) * frac * (frac - 1) / 6 * audio[i2]
+    )
+
+
+# Kernels apply_pipeline uses once it owns the working buffer. _IN_PLACE
+# kernels overwrite it and return it (or a new array when they cannot);
+# _PING_PONG kernels write into a spare buffer and return it, or return their
+# input unchanged when neutral. Each matches its stage function.
+_IN_PLACE = {
+    _eq: _eq_inplace,
+    _sos_filter: _sos_filter_inplace,
+    _saturate: _saturate_inplace,
+    _compress: _compress_inplace,
+    _bitcrush: _bitcrush_inplace,
+    _stereo_width: _stereo_width_inplace,
+    _noise: _noise_inplace,
+    _reverb: _reverb_inplace,
+    _limit: _limit_inplace,
+}
+_PING_PONG = {
+    _wow_flutter: _wow_flutter_into,
+    _modulated_delay: _modulated_delay_into,
+}
+# PipelinePlan stage functions whose last argument is the offset
+_POSITIONED = (_bitcrush, _modulated_delay, _noise)
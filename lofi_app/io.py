@@ -1,10 +1,307 @@
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import soundfile as sf
 
+# Decoded sample type unless asked otherwise; matches dsp.DEFAULT_DTYPE
+DEFAULT_DTYPE = "float32"
+DEFAULT_BLOCK_SIZE = 65536
+
+# libsndfile (format, subtype, options) per output extension; MP3 is about LAME -V2
+_SNDFILE_ENCODINGS = {
+    ".wav": ("WAV", None, {}),
+    ".flac": ("FLAC", None, {}),
+    ".ogg": ("OGG", "VORBIS", {}),
+    ".mp3": ("MP3", "MPEG_LAYER_III", {"bitrate_mode": "VARIABLE", "compression_level": 0.2}),
+}
+# ffmpeg output options for formats this libsndfile build cannot write
+_FFMPEG_ENCODINGS = {
+    ".wav": ["-codec:a", "pcm_s16le"],
+    ".flac": ["-codec:a", "flac"],
+    ".ogg": ["-codec:a", "libvorbis", "-qscale:a", "6"],
+    ".mp3": ["-codec:a", "libmp3lame", "-qscale:a", "2"],
+}
+ENCODER_FORMATS = tuple(ext.lstrip(".") for ext in _SNDFILE_ENCODINGS)
+
+# WAVE format tags whose samples can be read straight from a memory map
+_WAVE_PCM = 1
+_WAVE_FLOAT = 3
+_WAVE_EXTENSIBLE = 0xFFFE
+# Stored sample type and the (offset, scale) that maps it to [-1, 1), as libsndfile does
+_PCM_LAYOUTS = {
+    8: (np.uint8, -128.0, 1 / 128),
+    16: (np.int16, 0.0, 1 / 2**15),
+    32: (np.int32, 0.0, 1 / 2**31),
+}
 
-def load_audio(path):
-    audio, sr = sf.read(path, always_2d=True)
+
+def load_audio(path, dtype=DEFAULT_DTYPE, mmap=False):
+    """Decode ``path`` to a (frames, channels) array and return it with the sample rate.
+
+    With ``mmap``, a WAV stored as ``dtype`` floats is returned as a
+    read-only memory map instead, so it is paged in from disk as it is used
+    rather than decoded up front; other files are decoded as usual.
+    """
+    if mmap:
+        samples = memmap_audio(path)
+        if samples is not None and samples.dtype == np.dtype(dtype):
+            return samples, sf.info(path).samplerate
+    audio, sr = sf.read(path, dtype=dtype, always_2d=True)
     return audio, sr
 
 
-def save_audio(path, audio, sr):
-    sf.write(path, audio, sr)
+class EncoderError(RuntimeError):
+    """An output file could not be encoded."""
+
+
+def save_audio(path, audio, sr, block_size=DEFAULT_BLOCK_SIZE):
+    """Encode ``audio`` to ``path`` a block at a time, in the format its extension names.
+
+    ``path`` may be a list of paths to encode several formats at once (see
+    open_encoders).
+    """
+    paths = [path] if isinstance(path, (str, os.PathLike)) else path
+    with open_encoders(paths, sr, audio.shape[1] if audio.ndim > 1 else 1) as writer:
+        for start in range(0, len(audio), block_size):
+            writer.write(audio[start : start + block_size])
+
+
+def audio_info(path):
+    """Return (sample_rate, channels, frames) without decoding the file."""
+    info = sf.info(path)
+    return info.samplerate, info.channels, info.frames
+
+
+def read_blocks(path, block_size=DEFAULT_BLOCK_SIZE, dtype=DEFAULT_DTYPE, reuse=False):
+    """Yield successive (frames, channels) blocks, decoded like load_audio.
+
+    With ``reuse``, every block is a view of one buffer that the next block
+    overwrites, so nothing is allocated per block; the consumer must be done
+    with a block before asking for the next. Uncompressed WAVs are read
+    through a memory map rather than libsndfile.
+    """
+    samples = memmap_audio(path)
+    if samples is None:
+        with sf.SoundFile(path) as handle:
+            buffer = np.empty((block_size, handle.channels), dtype=dtype) if reuse else None
+            while True:
+                block = handle.read(block_size, dtype=dtype, always_2d=True, out=buffer)
+                if not len(block):
+                    return
+                yield block
+                if len(block) < block_size:
+                    return
+    else:
+        buffer = np.empty((block_size, samples.shape[1]), dtype=dtype) if reuse else None
+        for start in range(0, len(samples), block_size):
+            raw = samples[start : start + block_size]
+            out = None if buffer is None else buffer[: len(raw)]
+            yield _to_float(raw, dtype, out)
+
+
+def open_writer(path, sr, channels, subtype=None, append=False):
+    """Open a file for incremental writes with ``writer.write(block)``.
+
+    With ``append``, blocks are added after the audio already in ``path``
+    (which must match ``sr`` and ``channels``) instead of replacing it.
+    """
+    if append and os.path.exists(path):
+        writer = sf.SoundFile(path, "r+")
+        if writer.samplerate != sr or writer.channels != channels:
+            writer.close()
+            raise ValueError(
+                f"Cannot append {channels}-channel {sr} Hz audio to {path} "
+                f"({writer.channels} channels, {writer.samplerate} Hz)"
+            )
+        writer.seek(0, sf.SEEK_END)
+        return writer
+    return sf.SoundFile(path, "w", samplerate=sr, channels=channels, subtype=subtype)
+
+
+def open_encoder(path, sr, channels):
+    """Writer encoding ``write(block)`` calls to ``path`` as the format its extension names.
+
+    WAV, FLAC, OGG (Vorbis) and MP3 are encoded in-process by libsndfile
+    when the installed build supports them; otherwise blocks are piped as
+    raw float32 PCM into an ffmpeg process, which encodes while the caller
+    keeps producing. Raises EncoderError if neither can write the format.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _SNDFILE_ENCODINGS:
+        raise EncoderError(f"Unsupported output format: {path} (use one of {', '.join(ENCODER_FORMATS)})")
+    fmt, subtype, options = _SNDFILE_ENCODINGS[ext]
+    if fmt in sf.available_formats() and (subtype is None or subtype in sf.available_subtypes(fmt)):
+        return sf.SoundFile(path, "w", samplerate=sr, channels=channels, format=fmt, subtype=subtype, **options)
+    if shutil.which("ffmpeg") is None:
+        raise EncoderError(f"Cannot write {ext} files: this libsndfile lacks {fmt} support and ffmpeg is not installed")
+    return FFmpegEncoder(path, sr, channels, _FFMPEG_ENCODINGS[ext])
+
+
+def open_encoders(paths, sr, channels):
+    """One writer that encodes every block to each of ``paths``, in parallel when there are several."""
+    writers = []
+    try:
+        for path in paths:
+            writers.append(open_encoder(path, sr, channels))
+    except Exception:
+        for writer in writers:
+            writer.close()
+        raise
+    return writers[0] if len(writers) == 1 else EncoderSet(writers)
+
+
+class EncoderSet:
+    """Fans blocks out to several writers on a thread pool.
+
+    libsndfile releases the GIL while encoding and ffmpeg runs in its own
+    process, so the formats encode concurrently; each ``write`` returns once
+    every writer has the block.
+    """
+
+    def __init__(self, writers):
+        self.writers = writers
+        self.pool = ThreadPoolExecutor(max_workers=len(writers))
+
+    def write(self, block):
+        for future in [self.pool.submit(writer.write, block) for writer in self.writers]:
+            future.result()
+
+    def close(self):
+        self.pool.shutdown()
+        errors = []
+        for writer in self.writers:
+            try:
+                writer.close()
+            except Exception as exc:
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FFmpegEncoder:
+    """Encodes blocks by streaming them as raw float32 PCM to an ffmpeg subprocess."""
+
+    def __init__(self, path, sr, channels, codec_args):
+        self.path = path
+        self.channels = channels
+        # A file rather than a pipe, so a chatty ffmpeg can never block on stderr
+        self.log = tempfile.TemporaryFile()
+        command = ["ffmpeg", "-y", "-loglevel", "error", "-f", "f32le", "-ar", str(sr), "-ac", str(channels)]
+        command += ["-i", "pipe:0", *codec_args, path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.log)
+
+    def write(self, block):
+        samples = np.ascontiguousarray(block, dtype="<f4").reshape(-1, self.channels)
+        try:
+            self.process.stdin.write(samples.data)
+        except BrokenPipeError:
+            self.process.wait()
+            raise EncoderError(f"ffmpeg stopped encoding {self.path}: {self._errors()}") from None
+
+    def close(self):
+        if self.process.stdin.closed:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.process.wait():
+            raise EncoderError(f"ffmpeg failed to encode {self.path}: {self._errors()}")
+        self.log.close()
+
+    def _errors(self):
+        self.log.seek(0)
+        return self.log.read().decode(errors="replace").strip() or f"exit status {self.process.returncode}"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def memmap_audio(path):
+    """Read-only (frames, channels) memory map of a WAV's samples in their stored type.
+
+    Returns None unless ``path`` is an uncompressed 8/16/32-bit PCM or
+    32/64-bit float WAV; read_blocks converts the integer types to float.
+    """
+    layout = _wav_layout(path)
+    if layout is None:
+        return None
+    offset, dtype, channels, frames = layout
+    if not frames:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(frames, channels))
+
+
+def _to_float(raw, dtype, out=None):
+    """Samples of ``raw`` as ``dtype`` floats in [-1, 1), written to ``out`` if given."""
+    if raw.dtype.kind == "f":
+        if out is None:
+            return raw.astype(dtype)
+        out[...] = raw
+        return out
+    _, shift, scale = _PCM_LAYOUTS[raw.dtype.itemsize * 8]
+    if out is None:
+        out = np.empty(raw.shape, dtype=dtype)
+    out[...] = raw
+    if shift:
+        out += shift
+    out *= scale
+    return out
+
+
+def _wav_layout(path):
+    """(data offset, sample dtype, channels, frames) for a memory-mappable WAV, else None."""
+    try:
+        with open(path, "rb") as handle:
+            header = handle.read(12)
+            if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+                return None
+            size = os.fstat(handle.fileno()).st_size
+            fmt = None
+            while True:
+                chunk = handle.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, chunk_size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+                if chunk_id == b"fmt ":
+                    fmt = handle.read(chunk_size)
+                    handle.seek(chunk_size % 2, os.SEEK_CUR)
+                elif chunk_id == b"data":
+                    data_start = handle.tell()
+                    break
+                else:
+                    # Chunks are padded to an even length
+                    handle.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+    except OSError:
+        return None
+    if fmt is None or len(fmt) < 16:
+        return None
+
+    tag, channels, _, _, block_align, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if tag == _WAVE_EXTENSIBLE and len(fmt) >= 26:
+        tag = struct.unpack("<H", fmt[24:26])[0]
+    if tag == _WAVE_PCM and bits in _PCM_LAYOUTS:
+        dtype = np.dtype(_PCM_LAYOUTS[bits][0])
+    elif tag == _WAVE_FLOAT and bits in (32, 64):
+        dtype = np.dtype(f"<f{bits // 8}")
+    else:
+        return None
+    if channels == 0 or block_align != channels * dtype.itemsize:
+        return None
+    # A writer that never finalised the header leaves the data size wrong; trust the file length
+    data_size = min(chunk_size, size - data_start)
+    return data_start, dtype.newbyteorder("<"), channels, data_size // block_align
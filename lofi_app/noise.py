@@ -0,0 +1,122 @@
+"""Seeded noise for dsp._noise: pink noise, vinyl crackle and tape hiss.
+
+Noise is generated in fixed chunks whose components each draw from their own
+np.random.Generator (PCG64) seeded by the seed and the chunk's index, and the
+pink filter carries its state, so a NoiseBank produces the same samples
+whether it is asked for one long block or many short ones, and can start at
+any position without generating what comes before it.
+"""
+
+import functools
+
+import numpy as np
+from scipy.signal import lfilter
+
+# Pinking filter (-3 dB/octave within 0.05 dB across the audio band) and the
+# gain that gives it the RMS of the old five-octave approximation.
+_PINK_B = np.array([0.049922035, -0.095993537, 0.050612699, -0.004408786])
+_PINK_A = np.array([1.0, -2.494956002, 2.017265875, -0.522189400])
+_PINK_GAIN = 0.2308 / 0.08606
+
+# Crossfade at the seam of a loopable noise bed
+_BED_FADE_SECONDS = 0.05
+# Frames per independently seeded chunk
+_CHUNK = 1 << 16
+
+
+class NoiseBank:
+    """Stream of the noise ``dsp._noise`` adds at ``amount``.
+
+    ``next(frames)`` returns the following ``frames`` samples, starting
+    ``offset`` samples into the stream. With ``bed_seconds`` > 0 it loops a
+    precomputed bed of that length instead of generating, which is cheaper
+    for long renders.
+    """
+
+    def __init__(self, sr, amount, channels, seed=0, dtype=np.float32, bed_seconds=0.0, offset=0):
+        self.amount = amount
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.bed = None
+        if bed_seconds > 0.0:
+            self.bed = noise_bed(sr, amount, channels, seed, self.dtype.name, bed_seconds)
+            self.position = offset % len(self.bed)
+            return
+
+        # A None seed draws fresh entropy once, shared by every chunk
+        self.entropy = np.random.SeedSequence(seed).entropy
+        # Vinyl crackle (random pops) - only at higher amounts
+        self.crackle_density = amount * 0.00005 if amount > 0.2 else 0.0
+        self.pink_zi = np.zeros((len(_PINK_A) - 1, channels))
+        self.index, self.position = divmod(offset, _CHUNK)
+        if self.index:
+            # The pinking filter's memory fades within a few thousand samples, so
+            # running it over the previous chunk gives the state it would have had
+            white = self._rngs(self.index - 1)[0].standard_normal((_CHUNK, channels), dtype=np.float32)
+            _, self.pink_zi = lfilter(_PINK_B, _PINK_A, white, axis=0, zi=self.pink_zi)
+        self.chunk = self._chunk(self.index)
+
+    def next(self, frames):
+        if self.bed is not None:
+            return self._loop(frames)
+        out = np.empty((frames, self.channels), dtype=self.dtype)
+        filled = 0
+        while filled < frames:
+            if self.position == _CHUNK:
+                self.index += 1
+                self.position = 0
+                self.chunk = self._chunk(self.index)
+            take = min(frames - filled, _CHUNK - self.position)
+            out[filled : filled + take] = self.chunk[self.position : self.position + take]
+            filled += take
+            self.position += take
+        return out
+
+    def _chunk(self, index):
+        """The noise for frames ``[index * _CHUNK, (index + 1) * _CHUNK)``; chunks must be made in order."""
+        amount = self.amount
+        pink_rng, hiss_rng, *crackle_rngs = self._rngs(index)
+
+        # Pink noise (more natural than white noise) - reduced intensity
+        white = pink_rng.standard_normal((_CHUNK, self.channels), dtype=np.float32)
+        pink, self.pink_zi = lfilter(_PINK_B, _PINK_A, white, axis=0, zi=self.pink_zi)
+        out = (pink * (_PINK_GAIN * amount * 0.004)).astype(self.dtype)
+
+        # Tape hiss (filtered white noise) - very subtle
+        if amount > 0.05:
+            hiss = hiss_rng.standard_normal((_CHUNK, self.channels), dtype=self.dtype)
+            hiss *= 0.003 * amount * 0.5
+            out += hiss
+
+        if self.crackle_density > 0.0:
+            for ch, rng in enumerate(crackle_rngs):
+                # Each sample pops with probability crackle_density, so the gaps are geometric
+                position = int(rng.geometric(self.crackle_density)) - 1
+                while position < _CHUNK:
+                    out[position, ch] += rng.uniform(-0.3, 0.3) * amount * 0.5
+                    position += int(rng.geometric(self.crackle_density))
+        return out
+
+    def _rngs(self, index):
+        """Pink, hiss and per-channel crackle generators for chunk ``index``."""
+        chunk_seed = np.random.SeedSequence(self.entropy, spawn_key=(index,))
+        return [np.random.Generator(np.random.PCG64(s)) for s in chunk_seed.spawn(2 + self.channels)]
+
+    def _loop(self, frames):
+        indices = (self.position + np.arange(frames)) % len(self.bed)
+        self.position = (self.position + frames) % len(self.bed)
+        return self.bed[indices]
+
+
+@functools.lru_cache(maxsize=8)
+def noise_bed(sr, amount, channels, seed, dtype, seconds):
+    """Loopable ``seconds``-long NoiseBank output; the seam is crossfaded."""
+    length = max(1, int(round(seconds * sr)))
+    fade = min(int(_BED_FADE_SECONDS * sr), length)
+    noise = NoiseBank(sr, amount, channels, seed, dtype).next(length + fade)
+    bed = noise[:length].copy()
+    # The bed's head blends in from what followed its tail, so the loop point has no click
+    ramp = np.sqrt(np.linspace(0.0, 1.0, fade, dtype=bed.dtype))[:, None]
+    bed[:fade] = bed[:fade] * ramp + noise[length:] * ramp[::-1]
+    bed.flags.writeable = False
+    return bed
@@ -0,0 +1,169 @@
+"""Render one long file on several cores: ``render_parallel(audio, sr, params, workers=4)``.
+
+apply_pipeline runs each stage over the whole file in turn, so a long mix
+keeps one core busy. Here the output is cut into one segment per worker and
+the segments are rendered in a process pool. Input and output live in shared
+memory: workers copy out only their own span and write their samples back in
+place, so no audio is pickled.
+
+Each segment is rendered from ``pre_roll`` seconds before its start, which
+brings the EQ filters, compressor envelope, wow/flutter delay line and reverb
+tail to the state the serial render has there; the wow/flutter LFO, bitcrush
+hold grid and noise continue from the segment's position (apply_pipeline's
+``offset``). Neighbouring segments overlap by ``crossfade`` seconds and are
+blended across it. The limiter needs the whole render's peak, so it runs once
+on the stitched result.
+
+A phase vocoder cannot pick up the phases another segment ended on, and
+segments rendered with fresh phases partly cancel where they are blended.
+With tempo or pitch changes, the stages up to and including tempo/pitch
+therefore run once over the whole file in this process, and only the stages
+after it are split. Either way the result matches apply_pipeline to within
+float rounding.
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from lofi_app import dsp
+from lofi_app.profiling import StageProfiler
+
+DEFAULT_CROSSFADE = 0.05
+# Input read past a segment's end for the resampling filters, phase vocoder and wow/flutter
+_LOOKAHEAD_SECONDS = 0.1
+# A segment must be at least this many pre-rolls long to be worth a process
+_MIN_SEGMENT_PRE_ROLLS = 4
+
+
+def render_parallel(audio, sr, params, workers=None, pre_roll=None, crossfade=DEFAULT_CROSSFADE, observer=None):
+    """apply_pipeline(audio, sr, params) rendered in segments across ``workers`` processes.
+
+    ``pre_roll`` defaults to dsp.pre_roll_seconds(params). ``observer`` may be a
+    StageProfiler: each worker profiles its segment and the totals are merged
+    into it. Audio too short to split is rendered in this process.
+    """
+    if params.get("noise", 0.0) > 0.0 and params.get("noise_seed", 0) is None:
+        # Every segment must draw from the same random stream
+        params = {**params, "noise_seed": np.random.SeedSequence().entropy}
+    if pre_roll is None:
+        pre_roll = dsp.pre_roll_seconds(params)
+    # Filter designs, the LFO table and the reverb are computed once here rather than in every worker.
+    # The limiter runs on the stitched result.
+    plan = dsp.PipelinePlan(sr, {**params, "limiter": 0.0})
+    ceiling = params.get("limiter", 0.95)
+    layout = params
+    if any(name == "tempo_pitch" for name, _, _ in plan.stages):
+        # Segments' phase vocoders would start from different phases: only split the stages after it
+        head, plan = plan.split("tempo_pitch")
+        audio = head.apply(audio, observer=observer)
+        layout = {}
+    segments = plan_segments(len(audio), sr, layout, workers or os.cpu_count(), pre_roll, crossfade)
+    if len(segments) == 1:
+        return dsp._limit_inplace(plan.apply(audio, observer=observer), ceiling)
+
+    dtype = plan.dtype
+    frames = segments[-1][-1]
+    profile = None if observer is None else getattr(observer, "trace_memory", False)
+    source = shared_memory.SharedMemory(create=True, size=max(1, audio.size * dtype.itemsize))
+    target = shared_memory.SharedMemory(create=True, size=max(1, frames * audio.shape[1] * dtype.itemsize))
+    try:
+        source_spec = (source.name, audio.shape, dtype.str)
+        target_spec = (target.name, (frames, audio.shape[1]), dtype.str)
+        _write_shared(source_spec, 0, audio)
+        with ProcessPoolExecutor(max_workers=len(segments)) as pool:
+            futures = [
+                pool.submit(_render_segment, source_spec, target_spec, plan, segment, profile)
+                for segment in segments
+            ]
+            results = [future.result() for future in futures]
+        processed = _read_shared(target_spec, 0, frames)
+    finally:
+        for shm in (source, target):
+            shm.close()
+            shm.unlink()
+
+    for (_, _, _, start, body, _), (head, stages) in zip(segments, results):
+        if len(head):
+            # Blend from the previous segment's end into this one's start
+            ramp = (np.arange(1, len(head) + 1) / (len(head) + 1)).astype(dtype)[:, None]
+            overlap = processed[start:body]
+            overlap -= ramp * overlap
+            overlap += ramp * head
+        if stages is not None:
+            observer.merge(stages)
+    return dsp._limit_inplace(processed, ceiling)
+
+
+def output_length(n_frames, params):
+    """Frames apply_pipeline returns for ``n_frames`` of input."""
+    up, down = dsp._varispeed_ratio(params.get("varispeed", 1.0))
+    frames = -(-n_frames * up // down)
+    rate = params.get("time_stretch", 1.0)
+    if rate != 1.0 or params.get("pitch_shift", 0.0) != 0.0:
+        frames = int(round(frames / rate))
+    return frames
+
+
+def plan_segments(n_frames, sr, params, count, pre_roll, crossfade=DEFAULT_CROSSFADE):
+    """``(in_start, in_stop, offset, start, body, stop)`` for up to ``count`` segments.
+
+    A segment renders ``audio[in_start:in_stop]``, whose first output frame
+    is frame ``offset`` of the full render, and keeps output frames
+    ``[start, stop)``. Frames from ``body`` on are its own; the ones before
+    are crossfaded with the previous segment.
+    """
+    frames = output_length(n_frames, params)
+    fade = int(round(crossfade * sr))
+    min_frames = max(int(_MIN_SEGMENT_PRE_ROLLS * pre_roll * sr), 2 * fade, 1)
+    count = max(1, min(count, frames // min_frames))
+    up, down = dsp._varispeed_ratio(params.get("varispeed", 1.0))
+    # Exact for varispeed; tempo and pitch only approximately keep this ratio
+    scale = Fraction(up, down) / Fraction(params.get("time_stretch", 1.0))
+    pre_frames = math.ceil(pre_roll * sr / scale)
+    lookahead = math.ceil(_LOOKAHEAD_SECONDS * sr / scale)
+
+    bounds = [frames * i // count for i in range(count + 1)]
+    segments = []
+    for i in range(count):
+        start = max(bounds[i] - fade, 0)
+        in_start = max(math.floor(start / scale) - pre_frames, 0)
+        # On the resampler's grid, so the segment's output frames line up with the full render's
+        in_start -= in_start % down
+        in_stop = n_frames if i == count - 1 else min(math.ceil(bounds[i + 1] / scale) + lookahead, n_frames)
+        segments.append((in_start, in_stop, int(round(in_start * scale)), start, bounds[i], bounds[i + 1]))
+    return segments
+
+
+def _render_segment(source, target, plan, segment, profile):
+    """Worker: render one segment into the shared output; return its crossfade head and stage profile."""
+    in_start, in_stop, offset, start, body, stop = segment
+    profiler = None if profile is None else StageProfiler(trace_memory=profile)
+    span = _read_shared(source, in_start, in_stop)
+    rendered = plan.apply(span, observer=profiler, offset=offset)[start - offset : stop - offset]
+    _write_shared(target, body, rendered[body - start :])
+    return rendered[: body - start].copy(), None if profiler is None else profiler.stages
+
+
+# Views of shared memory only live inside one statement, so the block can
+# always be closed, even while a traceback holds on to a failed render.
+def _read_shared(spec, start, stop):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, dtype, buffer=shm.buf)[start:stop].copy()
+    finally:
+        shm.close()
+
+
+def _write_shared(spec, start, block):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        np.ndarray(shape, dtype, buffer=shm.buf)[start : start + len(block)] = block
+    finally:
+        shm.close()
@@ -1,5 +1,6 @@
 PRESETS = {
     "Cozy Vinyl": {
+        "varispeed": 1.0,
         "time_stretch": 0.92,
         "pitch_shift": -2.0,
         "highpass_hz": 30,
@@ -14,9 +15,11 @@ PRESETS = {
         "stereo_width": 1.0,
         "noise": 0.08,
         "reverb": 0.2,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Tape Bedroom": {
+        "varispeed": 1.0,
         "time_stretch": 0.9,
         "pitch_shift": -3.0,
         "highpass_hz": 30,
@@ -31,9 +34,11 @@ PRESETS = {
         "stereo_width": 0.85,
         "noise": 0.12,
         "reverb": 0.15,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Rainy Night": {
+        "varispeed": 1.0,
         "time_stretch": 0.95,
         "pitch_shift": -1.0,
         "highpass_hz": 30,
@@ -48,9 +53,11 @@ PRESETS = {
         "stereo_width": 1.2,
         "noise": 0.06,
         "reverb": 0.4,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Chill Study": {
+        "varispeed": 1.0,
         "time_stretch": 0.97,
         "pitch_shift": 0.0,
         "highpass_hz": 30,
@@ -65,9 +72,11 @@ PRESETS = {
         "stereo_width": 1.0,
         "noise": 0.03,
         "reverb": 0.1,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Nostalgic 90s": {
+        "varispeed": 1.0,
         "time_stretch": 0.88,
         "pitch_shift": -2.5,
         "highpass_hz": 40,
@@ -82,9 +91,11 @@ PRESETS = {
         "stereo_width": 0.9,
         "noise": 0.08,
         "reverb": 0.12,
+        "reverb_mode": "convolution",
         "limiter": 0.9,
     },
     "Late Night Drive": {
+        "varispeed": 1.0,
         "time_stretch": 0.94,
         "pitch_shift": -1.5,
         "highpass_hz": 30,
@@ -99,9 +110,11 @@ PRESETS = {
         "stereo_width": 1.3,
         "noise": 0.04,
         "reverb": 0.25,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Jazz Cafe": {
+        "varispeed": 1.0,
         "time_stretch": 0.96,
         "pitch_shift": -0.5,
         "highpass_hz": 30,
@@ -116,9 +129,11 @@ PRESETS = {
         "stereo_width": 1.0,
         "noise": 0.1,
         "reverb": 0.3,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Dreamy Clouds": {
+        "varispeed": 1.0,
         "time_stretch": 0.93,
         "pitch_shift": -1.0,
         "highpass_hz": 30,
@@ -133,9 +148,11 @@ PRESETS = {
         "stereo_width": 1.4,
         "noise": 0.02,
         "reverb": 0.6,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "VHS Memory": {
+        "varispeed": 1.0,
         "time_stretch": 0.89,
         "pitch_shift": -3.5,
         "highpass_hz": 50,
@@ -150,9 +167,11 @@ PRESETS = {
         "stereo_width": 0.7,
         "noise": 0.2,
         "reverb": 0.2,
+        "reverb_mode": "convolution",
         "limiter": 0.9,
     },
     "Coffee Shop": {
+        "varispeed": 1.0,
         "time_stretch": 0.98,
         "pitch_shift": 0.0,
         "highpass_hz": 30,
@@ -167,9 +186,11 @@ PRESETS = {
         "stereo_width": 1.1,
         "noise": 0.05,
         "reverb": 0.25,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
     "Midnight Radio": {
+        "varispeed": 1.0,
         "time_stretch": 0.91,
         "pitch_shift": -2.0,
         "highpass_hz": 500,
@@ -184,9 +205,11 @@ PRESETS = {
         "stereo_width": 0.5,
         "noise": 0.25,
         "reverb": 0.15,
+        "reverb_mode": "convolution",
         "limiter": 0.9,
     },
     "Sunset Beach": {
+        "varispeed": 1.0,
         "time_stretch": 0.95,
         "pitch_shift": -1.0,
         "highpass_hz": 30,
@@ -201,6 +224,61 @@ PRESETS = {
         "stereo_width": 1.25,
         "noise": 0.06,
         "reverb": 0.45,
+        "reverb_mode": "convolution",
         "limiter": 0.95,
     },
+    "Slowed Tape": {
+        "varispeed": 0.88,
+        "time_stretch": 1.0,
+        "pitch_shift": 0.0,
+        "highpass_hz": 30,
+        "lowpass_hz": 11000,
+        "bass_db": 2.5,
+        "highshelf_freq": 9000,
+        "highshelf_db": -2.5,
+        "saturation": 0.55,
+        "compression": 0.25,
+        "bitcrush": 0.0,
+        "wow_flutter": 0.35,
+        "stereo_width": 0.9,
+        "noise": 0.1,
+        "reverb": 0.2,
+        "reverb_mode": "convolution",
+        "limiter": 0.95,
+    },
+}
+
+# GUI slider range of each parameter it exposes, and the number of steps across it
+SLIDER_RANGES = {
+    "saturation": (0.0, 1.0),
+    "wow_flutter": (0.0, 1.0),
+    "noise": (0.0, 0.5),
+    "reverb": (0.0, 0.8),
+    "time_stretch": (0.8, 1.05),
+    "pitch_shift": (-4.0, 2.0),
+    "varispeed": (0.7, 1.1),
 }
+SLIDER_STEPS = 100
+# Values at which a stage does nothing, so the pipeline leaves it out
+NEUTRAL = {"time_stretch": 1.0, "pitch_shift": 0.0, "varispeed": 1.0}
+
+
+def slider_position(key, value):
+    """Nearest slider step for ``value`` of parameter ``key``."""
+    low, high = SLIDER_RANGES[key]
+    return min(max(round((value - low) / (high - low) * SLIDER_STEPS), 0), SLIDER_STEPS)
+
+
+def slider_value(key, position):
+    """Parameter value at slider step ``position``.
+
+    A step within half a step of the neutral value is exactly neutral, so a
+    preset without tempo or pitch changes still skips that stage after a
+    round trip through the sliders.
+    """
+    low, high = SLIDER_RANGES[key]
+    value = low + (high - low) * position / SLIDER_STEPS
+    neutral = NEUTRAL.get(key)
+    if neutral is not None and abs(value - neutral) <= (high - low) / SLIDER_STEPS / 2:
+        return neutral
+    return value
@@ -0,0 +1,111 @@
+"""Per-stage cost reports for dsp.apply_pipeline and streaming.iter_pipeline.
+
+Both accept ``observer=``, a callable given one record per stage call:
+
+    {"stage": "reverb", "wall": 0.41, "cpu": 0.40, "in_shape": (n, 2),
+     "out_shape": (n, 2), "dtype": "float32", "allocated": 21168128}
+
+``wall`` and ``cpu`` are seconds (``cpu`` is process time, so it includes
+helper threads). ``allocated`` is the peak number of bytes the call
+allocated on top of what was already in use, or None unless the observer
+has a true ``trace_memory`` attribute; tracemalloc then runs for the render
+and slows it down. Streaming calls the observer once per stage per block.
+"""
+
+import contextlib
+import time
+import tracemalloc
+
+
+class StageProfiler:
+    """Observer that adds up what each stage cost over one or more renders."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def __call__(self, record):
+        self._add(record["stage"], 1, record["wall"], record["cpu"], record["allocated"])
+
+    def merge(self, stages):
+        """Add totals from another profiler's ``stages``, e.g. one from a worker process."""
+        for name, other in stages.items():
+            self._add(name, other["calls"], other["wall"], other["cpu"], other["allocated"])
+
+    def summary(self, top=3):
+        """One line naming the most expensive stages, for a status bar."""
+        total = sum(totals["wall"] for totals in self.stages.values())
+        slowest = sorted(self.stages.items(), key=lambda item: item[1]["wall"], reverse=True)[:top]
+        return ", ".join(f"{name} {totals['wall']:.1f}s ({_share(totals['wall'], total)})" for name, totals in slowest)
+
+    def report(self):
+        """Table of every stage in pipeline order with its share of the total time."""
+        total = sum(totals["wall"] for totals in self.stages.values())
+        lines = [f"{'stage':<14}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'share':>8}{'peak alloc':>12}"]
+        for name, totals in self.stages.items():
+            allocated = "-" if totals["allocated"] is None else f"{totals['allocated'] / 2**20:.1f} MB"
+            lines.append(
+                f"{name:<14}{totals['calls']:>7}{totals['wall']:>10.3f}{totals['cpu']:>10.3f}"
+                f"{_share(totals['wall'], total):>8}{allocated:>12}"
+            )
+        lines.append(f"{'total':<14}{'':>7}{total:>10.3f}")
+        return "\n".join(lines)
+
+    def _add(self, name, calls, wall, cpu, allocated):
+        totals = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "allocated": None})
+        totals["calls"] += calls
+        totals["wall"] += wall
+        totals["cpu"] += cpu
+        if allocated is not None:
+            totals["allocated"] = max(totals["allocated"] or 0, allocated)
+
+
+def observe(observer, name, audio, run):
+    """Call ``run()`` for stage ``name`` on ``audio`` and report it to ``observer``; return its result."""
+    in_shape = audio.shape
+    traced = getattr(observer, "trace_memory", False) and tracemalloc.is_tracing()
+    if traced:
+        _reset_peak()
+        in_use = tracemalloc.get_traced_memory()[0]
+    started, cpu_started = time.perf_counter(), time.process_time()
+    out = run()
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    observer(
+        {
+            "stage": name,
+            "wall": wall,
+            "cpu": cpu,
+            "in_shape": in_shape,
+            "out_shape": out.shape,
+            "dtype": out.dtype.name,
+            "allocated": tracemalloc.get_traced_memory()[1] - in_use if traced else None,
+        }
+    )
+    return out
+
+
+def _reset_peak():
+    """tracemalloc.reset_peak, which is new in Python 3.9; restarting tracing clears the peak on 3.8."""
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        frames = tracemalloc.get_traceback_limit()
+        tracemalloc.stop()
+        tracemalloc.start(frames)
+
+
+@contextlib.contextmanager
+def tracing(observer):
+    """Run tracemalloc for the block if ``observer`` wants allocations and it is not already on."""
+    start = observer is not None and getattr(observer, "trace_memory", False) and not tracemalloc.is_tracing()
+    if start:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if start:
+            tracemalloc.stop()
+
+
+def _share(seconds, total):
+    return f"{seconds / total * 100:.0f}%" if total else "-"
@@ -0,0 +1,121 @@
+"""Finished renders keyed by what determines them, so repeating a render is free.
+
+The key covers the source samples, the sample rate, the stages a
+dsp.PipelinePlan keeps for the params with their resolved arguments, and a
+DSP version stamp hashed from the processing code and library versions, so
+entries from older code are never served. Neutral stages are left out and
+numbers are compared by value, so params that render the same (defaults
+spelled out, ``0`` and ``0.0``, settings of a disabled effect) share an
+entry; the noise seed is included. Renders with ``"noise_seed": None`` are
+random and never cached.
+"""
+
+import hashlib
+import numbers
+import os
+from pathlib import Path
+
+import librosa
+import numpy as np
+import scipy
+
+from lofi_app import dsp, noise, reverb
+from lofi_app.decode_cache import NpyStore
+
+DEFAULT_MAX_BYTES = 512 << 20
+DEFAULT_DISK_MAX_BYTES = 8 << 30
+
+
+def dsp_version():
+    """Short hash of the processing modules' source and the numeric libraries they run on."""
+    digest = hashlib.blake2b(digest_size=8)
+    for module in (dsp, noise, reverb):
+        digest.update(Path(module.__file__).read_bytes())
+    for library in (np, scipy, librosa):
+        digest.update(library.__version__.encode())
+    return digest.hexdigest()
+
+
+DSP_VERSION = dsp_version()
+
+
+def default_directory():
+    """``$LOFI_RENDER_CACHE``, else ``lofi-music/renders`` under the user cache directory."""
+    if os.environ.get("LOFI_RENDER_CACHE"):
+        return Path(os.environ["LOFI_RENDER_CACHE"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "lofi-music" / "renders"
+
+
+class RenderCache(dsp.ArrayLRU):
+    """apply_pipeline results in an LRU memory tier bounded by ``max_bytes``, plus an optional disk tier.
+
+    With a ``directory``, renders are also stored there as ``.npy`` files (up
+    to ``disk_max_bytes``) and survive restarts; disk hits are memory-mapped
+    and promoted to the memory tier. Cached renders are returned read-only.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, directory=None, disk_max_bytes=DEFAULT_DISK_MAX_BYTES):
+        super().__init__(max_bytes)
+        self.disk = NpyStore(directory, disk_max_bytes) if directory is not None else None
+
+    def render(self, audio, sr, params, **kwargs):
+        """The cached render of ``audio``, or apply_pipeline(audio, sr, params, **kwargs) stored for next time."""
+        key = self.key(audio, sr, params)
+        processed = self.get(key)
+        if processed is None:
+            processed = dsp.apply_pipeline(audio, sr, params, **kwargs)
+            self.put(key, processed)
+        return processed
+
+    def key(self, audio, sr, params):
+        """Hex key for rendering ``audio`` with ``params``, or None when the render is not repeatable."""
+        if params.get("noise", 0.0) > 0.0 and params.get("noise_seed", 0) is None:
+            return None
+        stages = [(name, _canonical(args)) for name, _, args in dsp.PipelinePlan(sr, params).stages]
+        with self._lock:
+            source = self._source_key(audio)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((source, sr, stages, DSP_VERSION)).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            processed = self._lookup(key)
+            if processed is not None:
+                self.hits += 1
+                return processed
+        processed = self.disk.open(f"{key}.npy") if self.disk is not None else None
+        with self._lock:
+            if processed is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._store(key, processed)
+        return processed
+
+    def put(self, key, processed):
+        if key is None:
+            return
+        processed.flags.writeable = False
+        with self._lock:
+            self._store(key, processed)
+        if self.disk is not None:
+            self.disk.save(f"{key}.npy", processed)
+
+
+def _canonical(value):
+    """``value`` with every number in one spelling and arrays replaced by their content hash."""
+    if isinstance(value, (tuple, list)):
+        return tuple(_canonical(item) for item in value)
+    if isinstance(value, np.ndarray):
+        return dsp.content_hash(value)
+    if isinstance(value, bool) or not isinstance(value, numbers.Real):
+        return value
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    # Integral floats as ints, so 1 and 1.0 match and large seeds keep every digit
+    value = float(value)
+    return int(value) if value.is_integer() else value
@@ -0,0 +1,198 @@
+"""Reverb engines: uniformly partitioned FFT convolution and a feedback delay network.
+
+Both process audio in blocks with carried state, so the same objects serve
+dsp._reverb (one call over the whole track) and the streaming pipeline.
+"""
+
+import functools
+import math
+
+import numpy as np
+import scipy.fft
+
+PARTITION_SIZE = 8192
+MODES = ("convolution", "fdn")
+
+# Delay lengths in samples at 44.1 kHz, mutually prime so echoes do not stack
+_FDN_DELAYS = (1116, 1277, 1422, 1617)
+# Orthogonal 4x4 Hadamard feedback matrix: lossless mixing, decay is set by the gains
+_FDN_MATRIX = np.array([[1, 1, 1, 1], [1, -1, 1, -1], [1, 1, -1, -1], [1, -1, -1, 1]]) / 2.0
+
+
+def impulse(sr, amount):
+    """Exponentially decaying 0.4 s impulse used by the convolution mode."""
+    decay = 0.3 + 1.2 * amount
+    length = int(sr * 0.4)
+    response = np.exp(-np.linspace(0, decay, length))
+    response[0] = 1.0
+    return response
+
+
+def make_engine(mode, sr, amount, channels, dtype=np.float32, design=None):
+    """Reverb engine for ``mode``; ``engine.process(block)`` returns the wet signal.
+
+    ``design`` is what design() returned for the same settings, to skip
+    computing it again.
+    """
+    if mode == "convolution":
+        return PartitionedConvolver(sr, amount, channels, dtype, spectra=design)
+    if mode == "fdn":
+        return FeedbackDelayNetwork(sr, amount, channels, dtype, scale=design)
+    raise ValueError(f"Unknown reverb mode: {mode}")
+
+
+def design(mode, sr, amount, dtype=np.float32):
+    """The precomputed part of an engine: impulse spectra for convolution, the output gain for fdn."""
+    if mode == "convolution":
+        return _impulse_spectra(sr, amount, PARTITION_SIZE, np.dtype(dtype).name)
+    if mode == "fdn":
+        return _fdn_scale(sr, amount)
+    raise ValueError(f"Unknown reverb mode: {mode}")
+
+
+def tail_seconds(mode, amount):
+    """How long the wet signal keeps ringing after the input stops, to well below -120 dB."""
+    if mode == "fdn":
+        return 2.0 * _fdn_t60(amount)
+    return 0.4
+
+
+class PartitionedConvolver:
+    """Uniformly partitioned overlap-save convolution with impulse().
+
+    Input of any length is consumed in PARTITION_SIZE steps against a
+    frequency-domain delay line of past input spectra. Output lags input by
+    up to one partition when blocks do not line up with partitions; ``flush``
+    returns what is still held back.
+    """
+
+    def __init__(self, sr, amount, channels, dtype=np.float32, spectra=None):
+        self.dtype = np.dtype(dtype)
+        if spectra is None:
+            spectra = _impulse_spectra(sr, amount, PARTITION_SIZE, self.dtype.name)
+        self.spectra = spectra[:, :, None]
+        partitions, bins, _ = self.spectra.shape
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.history = np.zeros((partitions, bins, channels), dtype=complex_dtype)
+        self.newest = 0
+        # Overlap-save frame: the previous partition followed by the current one
+        self.frame = np.zeros((2 * PARTITION_SIZE, channels), dtype=self.dtype)
+        self.spectrum = np.empty((bins, channels), dtype=complex_dtype)
+        self.product = np.empty_like(self.spectrum)
+        self.pending = np.zeros((0, channels), dtype=self.dtype)
+
+    def process(self, block):
+        size = PARTITION_SIZE
+        if len(self.pending):
+            block = np.concatenate([self.pending, block])
+        usable = len(block) // size * size
+        out = np.empty((usable, block.shape[1]), dtype=self.dtype)
+        for start in range(0, usable, size):
+            out[start : start + size] = self._partition(block[start : start + size])
+        self.pending = block[usable:].copy()
+        return out
+
+    def flush(self):
+        """Wet signal for input still short of a full partition."""
+        held = len(self.pending)
+        if not held:
+            return self.pending
+        tail = np.zeros((PARTITION_SIZE - held, self.pending.shape[1]), dtype=self.dtype)
+        return self.process(tail)[:held]
+
+    def _partition(self, current):
+        size = PARTITION_SIZE
+        self.frame[:size] = self.frame[size:]
+        self.frame[size:] = current
+        # The frequency-domain delay line is a ring: slot ``newest`` holds the
+        # spectrum of the latest partition, older ones follow cyclically.
+        partitions = len(self.spectra)
+        self.newest = (self.newest - 1) % partitions
+        self.history[self.newest] = scipy.fft.rfft(self.frame, axis=0)
+        np.multiply(self.spectra[0], self.history[self.newest], out=self.spectrum)
+        for p in range(1, partitions):
+            np.multiply(self.spectra[p], self.history[(self.newest + p) % partitions], out=self.product)
+            self.spectrum += self.product
+        return scipy.fft.irfft(self.spectrum, axis=0)[size:].astype(self.dtype, copy=False)
+
+
+@functools.lru_cache(maxsize=32)
+def _impulse_spectra(sr, amount, size, dtype):
+    """rfft of each ``size``-sample partition of impulse(), zero-padded to ``2 * size``."""
+    response = impulse(sr, amount).astype(dtype)
+    partitions = -(-len(response) // size)
+    padded = np.zeros(partitions * size, dtype=dtype)
+    padded[: len(response)] = response
+    blocks = np.zeros((partitions, 2 * size), dtype=dtype)
+    blocks[:, :size] = padded.reshape(partitions, size)
+    return scipy.fft.rfft(blocks, axis=1)
+
+
+class FeedbackDelayNetwork:
+    """Four-line feedback delay network, a cheap algorithmic alternative to convolution.
+
+    The tail's T60 grows with ``amount``; the output is scaled so its impulse
+    response carries the same energy as impulse(), keeping the wet level close
+    to the convolution mode. Work is vectorised over chunks no longer than
+    the shortest delay line, whose outputs depend only on earlier input.
+    """
+
+    def __init__(self, sr, amount, channels, dtype=np.float32, scale=None):
+        self.dtype = np.dtype(dtype)
+        self.delays, gains = _fdn_design(sr, amount)
+        scale = _fdn_scale(sr, amount) if scale is None else scale
+        lines = len(self.delays)
+        # One product gives every line's feedback input (mixing matrix times
+        # per-line gain) plus the scaled output sum in the last column.
+        self.weights = np.hstack([_FDN_MATRIX.T * gains[:, None], np.full((lines, 1), scale)])
+        self.chunk = min(self.delays)
+        self.longest = max(self.delays)
+        # Delay-line inputs, oldest first, written at ``position``; compacted when full
+        self.lines = np.zeros((self.longest + 32 * self.chunk, channels, lines))
+        self.position = self.longest
+
+    def process(self, block):
+        out = np.empty(block.shape, dtype=self.dtype)
+        for start in range(0, len(block), self.chunk):
+            chunk = block[start : start + self.chunk]
+            n = len(chunk)
+            if self.position + n > len(self.lines):
+                self.lines[: self.longest] = self.lines[self.position - self.longest : self.position]
+                self.position = self.longest
+            taps = np.stack(
+                [self.lines[self.position - d : self.position - d + n, :, i] for i, d in enumerate(self.delays)],
+                axis=-1,
+            )
+            # 2-D so the product is one matrix multiply rather than n small ones
+            mixed = (taps.reshape(-1, taps.shape[-1]) @ self.weights).reshape(*taps.shape[:-1], -1)
+            out[start : start + n] = mixed[..., -1]
+            fresh = self.lines[self.position : self.position + n]
+            np.add(mixed[..., :-1], chunk[:, :, None], out=fresh)
+            self.position += n
+        return out
+
+    def flush(self):
+        return np.zeros((0, self.lines.shape[1]), dtype=self.dtype)
+
+
+@functools.lru_cache(maxsize=32)
+def _fdn_design(sr, amount):
+    """(delays, per-line feedback gains) for FeedbackDelayNetwork."""
+    delays = tuple(max(1, int(round(d * sr / 44100))) for d in _FDN_DELAYS)
+    gains = np.array([10 ** (-3 * d / (_fdn_t60(amount) * sr)) for d in delays])
+    return delays, gains
+
+
+@functools.lru_cache(maxsize=32)
+def _fdn_scale(sr, amount):
+    """Output gain giving the network's impulse response the energy of impulse()."""
+    probe = FeedbackDelayNetwork(sr, amount, 1, np.float64, scale=1.0)
+    # Long enough for the tail to reach -60 dB
+    unit = np.zeros((int(_fdn_t60(amount) * sr) + probe.longest, 1))
+    unit[0] = 1.0
+    energy = float(np.sum(probe.process(unit) ** 2))
+    return math.sqrt(float(np.sum(impulse(sr, amount) ** 2)) / energy)
+
+
+def _fdn_t60(amount):
+    return 0.4 + 1.6 * amount
@@ -0,0 +1,528 @@
+"""Block-streaming variant of dsp.apply_pipeline with bounded memory."""
+
+import functools
+import math
+import os
+import tempfile
+
+import numpy as np
+import soxr
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import get_window, sosfilt
+
+from lofi_app import dsp, noise, profiling, reverb
+from lofi_app.io import audio_info, open_encoders, open_writer, read_blocks
+
+DEFAULT_BLOCK_SIZE = 65536
+
+
+def stream_pipeline(
+    input_path, output_path, params, block_size=DEFAULT_BLOCK_SIZE, observer=None, decode_cache=None
+):
+    """Render ``input_path`` to ``output_path`` one block at a time.
+
+    Every stage carries its state (filter ``zi``, compressor envelope, delay
+    history, reverb tail, LFO phase) across blocks, so peak memory depends on
+    ``block_size`` rather than track length. The limiter needs the whole-track
+    peak, so while it is active the unlimited render is spooled to a temporary
+    file and scaled on a second pass.
+
+    The output format follows the extension (see io.open_encoder); pass a
+    list of paths to encode one render to several formats at once. With a
+    DecodeCache, the input is read from its cached decode. ``params`` may
+    also be a dsp.PipelinePlan for the input's sample rate.
+    """
+    sr, channels, _ = audio_info(input_path)
+    plan = dsp.as_plan(sr, params)
+    dtype = plan.dtype
+    if decode_cache is not None:
+        audio, sr = decode_cache.load(input_path, dtype)
+        source = (audio[start : start + block_size] for start in range(0, len(audio), block_size))
+    else:
+        # The dtype stage copies each block, so the reader can reuse one buffer
+        source = read_blocks(input_path, block_size, dtype, reuse=True)
+    blocks = iter_pipeline(source, sr, channels, plan, observer)
+
+    outputs = [output_path] if isinstance(output_path, (str, os.PathLike)) else output_path
+    ceiling = plan.params.get("limiter", 0.95)
+    if ceiling <= 0.0:
+        with open_encoders(outputs, sr, channels) as writer:
+            _write_all(blocks, writer)
+        return
+
+    fd, spool_path = tempfile.mkstemp(suffix=".w64")
+    os.close(fd)
+    try:
+        with open_writer(spool_path, sr, channels, subtype="DOUBLE") as spool:
+            peak = _write_all(blocks, spool)
+        scale = 1.0 if peak <= ceiling else (ceiling / peak) * 0.95
+        with open_encoders(outputs, sr, channels) as writer:
+            for block in read_blocks(spool_path, block_size, dtype, reuse=True):
+                block *= scale
+                writer.write(block)
+    finally:
+        os.unlink(spool_path)
+
+
+def iter_pipeline(blocks, sr, channels, params, observer=None):
+    """Yield processed blocks for an iterable of (frames, channels) input blocks.
+
+    This is stream_pipeline without the file I/O or the limiter, which needs
+    the whole-track peak; empty blocks are skipped. ``observer`` receives a
+    record per stage per block, as for dsp.apply_pipeline. ``params`` may be a
+    dsp.PipelinePlan.
+    """
+    stages = _build_stages(channels, dsp.as_plan(sr, params))
+    with profiling.tracing(observer):
+        for block in blocks:
+            block = _push(stages, block, observer)
+            if len(block):
+                yield block
+        for i, (_, stage) in enumerate(stages):
+            tail = stage.flush()
+            if tail is not None:
+                tail = _push(stages[i + 1:], tail, observer)
+                if len(tail):
+                    yield tail
+
+
+def _build_stages(channels, plan):
+    """(name, stage) pairs for a PipelinePlan's stages, except the limiter, which stream_pipeline applies."""
+    stages = []
+    for name, fn, args in plan.stages:
+        if name == "varispeed":
+            stage = _Varispeed(*args, channels)
+        elif name == "tempo_pitch":
+            sr, rate, n_steps = args
+            stage = _PitchShift(sr, n_steps, channels, rate) if n_steps != 0.0 else _PhaseVocoder(rate, channels)
+        elif name == "eq":
+            stage = _Filter(*args, channels)
+        elif name == "compress":
+            stage = _Compressor(*args)
+        elif name == "bitcrush":
+            stage = _Bitcrush(args[1])
+        elif name == "wow_flutter":
+            stage = _WowFlutter(*args, channels)
+        elif name == "noise":
+            stage = _Noise(*args[:2], channels, *args[2:], plan.dtype)
+        elif name == "reverb":
+            sr, amount, mode, design = args
+            stage = _Reverb(sr, amount, mode, channels, plan.dtype, design)
+        elif name == "limit":
+            continue
+        else:
+            stage = _Map(fn, *args)
+        stages.append((name, stage))
+    return stages
+
+
+def _write_all(blocks, writer):
+    """Write every block; return the output peak."""
+    peak = 0.0
+    for block in blocks:
+        writer.write(block)
+        peak = max(peak, float(np.max(np.abs(block))))
+    return peak
+
+
+def _push(stages, block, observer=None):
+    for name, stage in stages:
+        if not len(block):
+            break
+        if observer is None:
+            block = stage.process(block)
+        else:
+            block = profiling.observe(observer, name, block, functools.partial(stage.process, block))
+    return block
+
+
+class _Map:
+    """Stateless per-sample stage."""
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def process(self, block):
+        return self.fn(block, *self.args)
+
+    def flush(self):
+        return None
+
+
+class _Filter:
+    """SOS cascade; state stays float64 whatever the block dtype, as in dsp._eq."""
+
+    def __init__(self, sos, channels):
+        self.sos = sos
+        self.zi = np.zeros((len(sos), 2, channels))
+
+    def process(self, block):
+        out, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return out.astype(block.dtype, copy=False)
+
+    def flush(self):
+        return None
+
+
+class _Compressor:
+    def __init__(self, amount):
+        self.amount = amount
+        self.env = 0.0
+        self.gain = 1.0
+        self.first = True
+
+    def process(self, block):
+        peak = np.abs(block).max(axis=1).astype(np.float64)
+        if self.first:
+            peak[0] = 0.0
+            self.first = False
+        env, gain = dsp._compressor_gain(peak, self.amount, self.env, self.gain)
+        self.env, self.gain = env[-1], gain[-1]
+        return block * gain[:, None].astype(block.dtype)
+
+    def flush(self):
+        return None
+
+
+class _Bitcrush:
+    """Bit reduction plus sample-and-hold whose phase continues across blocks."""
+
+    def __init__(self, amount):
+        self.amount = amount
+        self.factor = dsp._downsample_factor(amount)
+        self.position = 0
+        self.held = None
+
+    def process(self, block):
+        crushed = dsp._reduce_bits(block, self.amount)
+        if self.factor > 1:
+            positions = self.position + np.arange(len(block))
+            source = positions - positions % self.factor - self.position
+            held = crushed[np.maximum(source, 0)]
+            if self.held is not None:
+                held[source < 0] = self.held
+            crushed = held
+            self.held = crushed[-1].copy()
+        self.position += len(block)
+        return crushed
+
+    def flush(self):
+        return None
+
+
+class _WowFlutter:
+    """Modulated delay line with look-ahead; output lags input by the delay reach.
+
+    ``table`` is the delay curve over one LFO period, as dsp._modulated_delay takes it.
+    """
+
+    def __init__(self, table, interp, channels):
+        self.table = table
+        self.interp = interp
+        # Margin for the interpolation kernel around the farthest read position.
+        self.reach = int(math.ceil(np.abs(table).max())) + 3
+        self.buffer = np.zeros((0, channels))
+        self.buffer_start = 0
+        self.position = 0
+
+    def process(self, block):
+        if not len(self.buffer):
+            self.buffer = self.buffer.astype(block.dtype)
+        self.buffer = np.concatenate([self.buffer, block])
+        return self._render(self.buffer_start + len(self.buffer) - self.reach)
+
+    def flush(self):
+        return self._render(self.buffer_start + len(self.buffer))
+
+    def _render(self, stop):
+        if stop <= self.position:
+            return self.buffer[:0]
+        positions = np.arange(self.position, stop)
+        idx = positions - np.take(self.table, positions, mode="wrap")
+        out = np.zeros((len(positions), self.buffer.shape[1]), dtype=self.buffer.dtype)
+        # Before flush, every read lies well inside the received input.
+        valid = (idx > 0) & (idx < self.buffer_start + len(self.buffer) - 1)
+        if valid.any():
+            out[valid] = dsp._interpolate(self.buffer, idx[valid] - self.buffer_start, self.interp)
+        self.position = stop
+
+        keep_from = max(self.position - self.reach, self.buffer_start)
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        return out
+
+
+class _Noise:
+    """dsp._noise with one bank across blocks, so the noise matches the offline render."""
+
+    def __init__(self, sr, amount, channels, seed, bed_seconds, dtype):
+        self.bank = noise.NoiseBank(sr, amount, channels, seed, dtype, bed_seconds)
+
+    def process(self, block):
+        return block + self.bank.next(len(block))
+
+    def flush(self):
+        return None
+
+
+class _Reverb:
+    """Dry/wet mix around a reverb engine, holding dry input while the engine lags."""
+
+    def __init__(self, sr, amount, mode, channels, dtype, design=None):
+        self.amount = amount
+        self.engine = reverb.make_engine(mode, sr, amount, channels, dtype, design)
+        self.dry = np.zeros((0, channels), dtype=dtype)
+
+    def process(self, block):
+        return self._mix(block, self.engine.process(block))
+
+    def flush(self):
+        # Like the offline path, the tail past the input length is dropped.
+        return self._mix(self.dry[:0], self.engine.flush())
+
+    def _mix(self, block, wet):
+        dry = np.concatenate([self.dry, block]) if len(self.dry) else block
+        self.dry = dry[len(wet):]
+        return (1 - self.amount) * dry[: len(wet)] + self.amount * wet
+
+
+class _Varispeed:
+    """Streaming ``resample_poly``: output m is sum_j x[j] * h[m * down + half_len - j * up]."""
+
+    def __init__(self, speed, channels, block_size=16384):
+        self.up, self.down = dsp._varispeed_ratio(speed)
+        h, self.half_len = dsp._varispeed_filter(self.up, self.down)
+        self.n_taps = -(-len(h) // self.up)
+        # Row p holds the taps seen by outputs whose filter phase is p.
+        h = np.pad(h, (0, self.n_taps * self.up + self.up - len(h)))
+        self.phases = h[np.arange(self.up)[:, None] + self.up * np.arange(self.n_taps)]
+        self.block_size = block_size
+        self.channels = channels
+        self.buffer = np.zeros((0, channels))
+        self.buffer_start = 0
+        self.n_in = 0
+        self.n_out = 0
+
+    def process(self, block):
+        if not len(self.buffer):
+            self.buffer = self.buffer.astype(block.dtype)
+        self.buffer = np.concatenate([self.buffer, block])
+        self.n_in += len(block)
+        # Output m needs input up to (m * down + half_len) // up.
+        ready = (self.n_in * self.up - self.half_len - 1) // self.down + 1
+        return self._render(max(ready, self.n_out))
+
+    def flush(self):
+        total = -(-self.n_in * self.up // self.down)
+        return self._render(total)
+
+    def _render(self, stop):
+        parts = []
+        for start in range(self.n_out, stop, self.block_size):
+            m = np.arange(start, min(start + self.block_size, stop))
+            centre = m * self.down + self.half_len
+            newest = centre // self.up
+            j = newest[:, None] - np.arange(self.n_taps) - self.buffer_start
+            inside = (j >= 0) & (j < len(self.buffer))
+            taps = self.buffer[np.where(inside, j, 0)] * inside[..., None]
+            weights = self.phases[centre - newest * self.up]
+            parts.append(np.einsum("mt,mtc->mc", weights, taps).astype(self.buffer.dtype))
+        self.n_out = stop
+
+        oldest = (self.n_out * self.down + self.half_len) // self.up - self.n_taps + 1
+        keep_from = min(max(oldest, self.buffer_start), self.buffer_start + len(self.buffer))
+        self.buffer = self.buffer[keep_from - self.buffer_start:]
+        self.buffer_start = keep_from
+        if not parts:
+            return self.buffer[:0]
+        return np.concatenate(parts)
+
+
+class _PhaseVocoder:
+    """Streaming equivalent of ``librosa.effects.time_stretch`` (centered Hann STFT)."""
+
+    def __init__(self, rate, channels, n_fft=2048, hop_length=512):
+        self.rate = rate
+        self.channels = channels
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.window = get_window("hann", n_fft, fftbins=True)
+        self.phi_advance = hop_length * np.linspace(0, np.pi, 1 + n_fft // 2)
+
+        self.dtype = None
+        self.n_in = 0
+        self.pending = None
+        self.spectra = []
+        self.first_frame = 0
+        self.n_frames = 0
+        self.phase = None
+        self.step = 0
+
+        self.ola = np.zeros((0, channels))
+        self.norm = np.zeros(0)
+        self.ola_start = 0
+        self.n_out = 0
+
+    def process(self, block):
+        if self.dtype is None:
+            self.dtype = block.dtype
+            self.pending = np.zeros((self.n_fft // 2, self.channels), dtype=block.dtype)
+        self.n_in += len(block)
+        self._analyze(block)
+        self._synthesize(final=False)
+        return self._emit(int(self.n_in / self.rate))
+
+    def flush(self):
+        if self.dtype is None:
+            return None
+        self._analyze(np.zeros((self.n_fft // 2, self.channels), dtype=self.dtype))
+        self._synthesize(final=True)
+        length = int(round(self.n_in / self.rate))
+        out = self._emit(length, final=True)
+        if self.n_out < length:
+            pad = np.zeros((length - self.n_out, self.channels), dtype=self.dtype)
+            out = np.concatenate([out, pad])
+            self.n_out = length
+        return out
+
+    def _analyze(self, block):
+        self.pending = np.concatenate([self.pending, block])
+        if len(self.pending) < self.n_fft:
+            return
+        frames = sliding_window_view(self.pending, self.n_fft, axis=0)[:: self.hop_length]
+        spectra = np.fft.rfft(self.window * frames, axis=-1).astype(np.result_type(self.dtype, np.complex64))
+        if self.phase is None:
+            self.phase = np.angle(spectra[0])
+        self.spectra.extend(spectra)
+        self.n_frames += len(spectra)
+        self.pending = self.pending[len(spectra) * self.hop_length:]
+
+    def _frame(self, index):
+        if index >= self.n_frames:
+            return np.zeros_like(self.phase)
+        return self.spectra[index - self.first_frame]
+
+    def _synthesize(self, final):
+        columns = []
+        while True:
+            step = self.step * self.rate
+            index = int(step)
+            # Past the last frame librosa pads with silent columns.
+            if final:
+                done = step >= self.n_frames
+            else:
+                done = index + 1 >= self.n_frames
+            if done:
+                break
+            left = self._frame(index)
+            right = self._frame(index + 1)
+
+            alpha = np.mod(step, 1.0)
+            mag = (1.0 - alpha) * np.abs(left) + alpha * np.abs(right)
+            columns.append(mag * (np.cos(self.phase) + 1j * np.sin(self.phase)))
+
+            dphase = np.angle(right) - np.angle(left) - self.phi_advance
+            dphase = dphase - 2.0 * np.pi * np.round(dphase / (2.0 * np.pi))
+            self.phase += self.phi_advance + dphase
+            self.step += 1
+
+        consumed = min(int(self.step * self.rate), self.n_frames) - self.first_frame
+        if consumed > 0:
+            del self.spectra[:consumed]
+            self.first_frame += consumed
+        if not columns:
+            return
+
+        frames = self.window * np.fft.irfft(np.stack(columns), n=self.n_fft, axis=-1)
+        first = self.step - len(columns)
+        end = (self.step - 1) * self.hop_length + self.n_fft - self.ola_start
+        self._grow(end)
+        win_sq = self.window ** 2
+        for k, frame in enumerate(frames):
+            offset = (first + k) * self.hop_length - self.ola_start
+            self.ola[offset:offset + self.n_fft] += frame.T
+            self.norm[offset:offset + self.n_fft] += win_sq
+
+    def _grow(self, length):
+        if length > len(self.norm):
+            extra = length - len(self.norm)
+            self.ola = np.concatenate([self.ola, np.zeros((extra, self.channels))])
+            self.norm = np.concatenate([self.norm, np.zeros(extra)])
+
+    def _emit(self, limit, final=False):
+        """Normalize and return finished output samples up to ``limit``."""
+        half = self.n_fft // 2
+        stop = limit
+        if not final:
+            # Samples before the next frame's start receive no further overlap-add.
+            stop = min(stop, self.step * self.hop_length - half)
+        if stop <= self.n_out:
+            return np.zeros((0, self.channels), dtype=self.dtype)
+        lo = self.n_out + half - self.ola_start
+        hi = stop + half - self.ola_start
+        self._grow(hi)
+        out = self.ola[lo:hi].copy()
+        norm = self.norm[lo:hi]
+        nonzero = norm > np.finfo(self.dtype).tiny
+        out[nonzero] /= norm[nonzero, None]
+
+        self.ola = self.ola[hi:]
+        self.norm = self.norm[hi:]
+        self.ola_start += hi
+        self.n_out = stop
+        return out.astype(self.dtype)
+
+
+class _PitchShift:
+    """Streaming equivalent of ``dsp._tempo_pitch``: stretch, then resample.
+
+    With ``rate`` != 1 the tempo change is folded into the same vocoder pass.
+    """
+
+    def __init__(self, sr, n_steps, channels, rate=1.0):
+        self.rate = rate
+        pitch_rate = 2.0 ** (-float(n_steps) / 12)
+        self.orig_sr = float(sr) / pitch_rate
+        self.sr = sr
+        self.channels = channels
+        self.vocoder = _PhaseVocoder(rate * pitch_rate, channels)
+        self.resampler = None
+        self.n_in = 0
+        self.n_out = 0
+        self.pending = None
+
+    def process(self, block):
+        if self.resampler is None:
+            self.resampler = soxr.ResampleStream(
+                self.orig_sr, self.sr, self.channels, dtype=block.dtype, quality="soxr_hq"
+            )
+            self.pending = block[:0]
+        self.n_in += len(block)
+        self._resample(self.vocoder.process(block), last=False)
+        # Total output is at least length - 1 samples, so this never overshoots.
+        return self._emit(int(self.n_in / self.rate) - 2)
+
+    def flush(self):
+        if self.resampler is None:
+            return None
+        stretched = self.vocoder.flush()
+        self._resample(stretched, last=True)
+        ratio = float(self.sr) / self.orig_sr
+        length = int(round(self.n_in / self.rate))
+        available = min(int(math.ceil(self.vocoder.n_out * ratio)), length)
+        out = self._emit(available)
+        pad = np.zeros((length - self.n_out, self.channels), dtype=out.dtype)
+        self.n_out = length
+        return np.concatenate([out, pad])
+
+    def _resample(self, block, last):
+        resampled = self.resampler.resample_chunk(np.ascontiguousarray(block), last=last)
+        self.pending = np.concatenate([self.pending, resampled])
+
+    def _emit(self, limit):
+        count = max(0, min(limit - self.n_out, len(self.pending)))
+        out = self.pending[:count]
+        self.pending = self.pending[count:]
+        self.n_out += count
+        return out
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+import pytest
+
+from lofi_app import cli
+
+
+def test_output_stems_mirror_input_folders():
+    inputs = [Path("albums/a/x.mp3"), Path("albums/b/x.mp3"), Path("albums/y.wav")]
+    stems = cli._output_stems(inputs, Path("out"))
+    assert stems == {
+        Path("albums/a/x.mp3"): Path("out/a/x"),
+        Path("albums/b/x.mp3"): Path("out/b/x"),
+        Path("albums/y.wav"): Path("out/y"),
+    }
+    assert cli._clashes(stems) == []
+
+
+def test_inputs_with_the_same_output_are_refused(tmp_path, capsys):
+    for name in ("x.wav", "x.flac"):
+        (tmp_path / name).touch()
+    with pytest.raises(SystemExit):
+        cli.main([str(tmp_path / "x.wav"), str(tmp_path / "x.flac"), "-o", str(tmp_path / "out"), "-p", "Jazz Cafe"])
+    assert "overwrite" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("argv", [["-j", "0"], ["--split", "0"], ["missing.wav"]])
+def test_bad_arguments_are_usage_errors(tmp_path, argv):
+    (tmp_path / "x.wav").touch()
+    with pytest.raises(SystemExit) as exc:
+        cli.main([str(tmp_path / "x.wav"), "-o", str(tmp_path / "out"), "-p", "Jazz Cafe", *argv])
+    assert exc.value.code == 2
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from lofi_app import dsp
+
+
+def _reference_compress(audio, amount):
+    """The per-sample envelope follower and gain smoother _compress replaces."""
+    threshold = 0.5
+    ratio = 1.0 + amount * 4.0
+    attack = 0.01
+    release = 0.1
+    env = 0.0
+    gain = np.ones(len(audio))
+    for i in range(1, len(audio)):
+        env = max(float(np.abs(audio[i]).max()), env * (1 - release))
+        target = 1.0
+        if env > threshold:
+            target = (threshold + (env - threshold) / ratio) / env
+        coeff = attack if target < gain[i - 1] else release
+        gain[i] = gain[i - 1] + coeff * (target - gain[i - 1])
+    return audio * gain[:, None]
+
+
+def _bursty(frames=20000, channels=2):
+    """Full-scale bursts, single-sample clicks and silence, so attack and release keep switching."""
+    rng = np.random.default_rng(4)
+    audio = 0.05 * rng.standard_normal((frames, channels))
+    for start in range(500, frames, 2300):
+        length = int(rng.integers(50, 900))
+        audio[start : start + length] = rng.uniform(-1.0, 1.0, (len(audio[start : start + length]), channels))
+    clicks = rng.integers(0, frames, 40)
+    audio[clicks] = rng.choice([-1.0, 1.0], (len(clicks), channels))
+    audio[frames // 2 : frames // 2 + 1500] = 0.0
+    return audio
+
+
+@pytest.mark.parametrize("amount", [0.2, 0.6, 1.0])
+def test_compress_matches_reference_recursion(amount):
+    audio = _bursty()
+    expected = _reference_compress(audio, amount)
+    np.testing.assert_allclose(dsp._compress(audio, amount), expected, rtol=0, atol=1e-5)
+    # Block boundaries every 1000 frames carry envelope and gain across
+    np.testing.assert_allclose(dsp._compress_inplace(audio.copy(), amount, 1000), expected, rtol=0, atol=1e-5)
+
+
+def test_smooth_gain_warns_when_not_converged():
+    target = np.where(np.arange(5000) % 700 < 300, 0.4, 1.0)
+    with pytest.warns(RuntimeWarning, match="did not converge"):
+        dsp._smooth_gain(target, 0.01, 0.1, max_iter=1)
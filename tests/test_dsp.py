@@ -0,0 +1,154 @@
+import warnings
+
+import librosa
+import numpy as np
+import pytest
+
+from lofi_app import dsp, streaming
+
+SR = 44100
+
+# Every stage active, so each one's output dtype is checked
+ALL_STAGES = {
+    "varispeed": 0.9,
+    "time_stretch": 0.95,
+    "pitch_shift": -1.0,
+    "lowpass_hz": 9000,
+    "bass_db": 3.0,
+    "highshelf_db": -4.0,
+    "saturation": 0.3,
+    "compression": 0.4,
+    "bitcrush": 0.3,
+    "wow_flutter": 0.5,
+    "stereo_width": 1.2,
+    "noise": 0.1,
+    "noise_bed": 0.5,
+    "noise_seed": 3,
+    "reverb": 0.3,
+    "limiter": 0.9,
+}
+
+
+def _audio(seconds=1.0, channels=2, dtype=np.float32):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * SR)) / SR
+    tone = 0.4 * np.sin(2 * np.pi * 220 * t)[:, None] * np.ones(channels)
+    return (tone + 0.05 * rng.standard_normal(tone.shape)).astype(dtype)
+
+
+@pytest.fixture(params=["convolution", "fdn"])
+def reverb_mode(request):
+    return request.param
+
+
+@pytest.fixture(params=[False, True], ids=["float32", "mastering"])
+def params(request, reverb_mode):
+    return {**ALL_STAGES, "reverb_mode": reverb_mode, "mastering": request.param}
+
+
+def test_every_stage_keeps_the_processing_dtype(params):
+    expected = dsp.processing_dtype(params)
+    # Input in the other precision, so the dtype stage has to convert it
+    current = _audio(dtype=np.float64 if expected == np.float32 else np.float32)
+    for name, fn, args in dsp._pipeline_stages(SR, params):
+        current = fn(current, *args)
+        assert current.dtype == expected, name
+
+
+def test_in_place_and_ping_pong_kernels_keep_the_processing_dtype(params):
+    expected = dsp.processing_dtype(params)
+    current = _audio()
+    for name, fn, args in dsp._pipeline_stages(SR, params):
+        if fn in dsp._IN_PLACE:
+            out = dsp._IN_PLACE[fn](current.copy(), *args)
+        elif fn in dsp._PING_PONG:
+            out = dsp._PING_PONG[fn](current, np.empty_like(current), *args)
+        else:
+            out = None
+        current = fn(current, *args)
+        if out is not None:
+            assert out.dtype == expected, name
+            np.testing.assert_allclose(out, current, atol=1e-5, err_msg=name)
+
+
+def test_pipeline_and_plan_output_dtype(params):
+    expected = dsp.processing_dtype(params)
+    audio = _audio()
+    assert dsp.apply_pipeline(audio, SR, params).dtype == expected
+    assert dsp.PipelinePlan(SR, params).apply(audio).dtype == expected
+
+
+def test_streaming_stages_keep_the_processing_dtype(params):
+    expected = dsp.processing_dtype(params)
+    audio = _audio().astype(expected)
+    stages = streaming._build_stages(audio.shape[1], dsp.PipelinePlan(SR, params))
+
+    def push(stages, block):
+        for name, stage in stages:
+            if not len(block):
+                break
+            block = stage.process(block)
+            assert block.dtype == expected, name
+
+    for start in range(0, len(audio), 8192):
+        push(stages, audio[start : start + 8192])
+    for i, (name, stage) in enumerate(stages):
+        tail = stage.flush()
+        if tail is not None:
+            assert tail.dtype == expected, name
+            push(stages[i + 1 :], tail)
+
+
+def _per_channel(audio, fn):
+    return np.stack([fn(audio[:, ch]) for ch in range(audio.shape[1])], axis=1)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_batched_time_stretch_matches_per_channel(dtype):
+    audio = _audio(dtype=dtype)
+    expected = _per_channel(audio, lambda ch: librosa.effects.time_stretch(ch, rate=0.9))
+    np.testing.assert_array_equal(dsp._tempo_pitch(audio, SR, 0.9, 0.0), expected)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_batched_pitch_shift_matches_per_channel(dtype):
+    audio = _audio(dtype=dtype)
+    expected = _per_channel(audio, lambda ch: librosa.effects.pitch_shift(ch, sr=SR, n_steps=-2.0))
+    np.testing.assert_array_equal(dsp._tempo_pitch(audio, SR, 1.0, -2.0), expected)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_batched_stretch_and_shift_matches_per_channel(dtype):
+    audio = _audio(dtype=dtype)
+    rate, n_steps = 0.9, -2.0
+    pitch_rate = 2.0 ** (-n_steps / 12)
+
+    def process(ch):
+        stretched = librosa.effects.time_stretch(ch, rate=rate * pitch_rate)
+        shifted = librosa.resample(stretched, orig_sr=SR / pitch_rate, target_sr=SR, res_type="soxr_hq")
+        return librosa.util.fix_length(shifted, size=int(round(len(ch) / rate)))
+
+    np.testing.assert_array_equal(dsp._tempo_pitch(audio, SR, rate, n_steps), _per_channel(audio, process))
+
+
+@pytest.mark.parametrize("cached", [False, True], ids=["uncached", "stage cache"])
+def test_empty_input_renders_empty(params, cached):
+    audio = np.zeros((0, 2), dtype=np.float32)
+    cache = dsp.StageCache() if cached else None
+    with warnings.catch_warnings():
+        # librosa notes that its FFT is longer than the input
+        warnings.simplefilter("ignore", UserWarning)
+        rendered = dsp.apply_pipeline(audio, SR, params, cache=cache)
+    assert rendered.shape == (0, 2)
+    assert rendered.dtype == dsp.processing_dtype(params)
+
+
+def test_render_window_pre_roll_covers_the_fdn_tail():
+    # A burst that has ended more than a second before the window, so only its reverb tail is left there
+    audio = _audio(seconds=6.0)
+    audio[2 * SR :] = 0.0
+    params = {"reverb": 0.6, "reverb_mode": "fdn", "limiter": 0.0}
+    full = dsp.apply_pipeline(audio, SR, params)[4 * SR : 5 * SR]
+    window = dsp.render_window(audio, SR, params, 4.0, 1.0)
+    assert np.abs(full).max() > 1e-4
+    np.testing.assert_allclose(window, full, atol=1e-6)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from lofi_app import dsp, parallel, presets
+
+SR = 44100
+# Segments continue the serial render's state exactly; what is left is float rounding
+TOLERANCE = 2e-6
+
+CASES = {
+    "bitcrush and seeded noise": {
+        **presets.PRESETS["Midnight Radio"],
+        "time_stretch": 1.0,
+        "pitch_shift": 0.0,
+        "bitcrush": 0.4,
+        "noise": 0.1,
+        "noise_seed": 9,
+    },
+    "fdn reverb": {**presets.PRESETS["Jazz Cafe"], "time_stretch": 1.0, "pitch_shift": 0.0, "reverb_mode": "fdn"},
+    "varispeed": {**presets.PRESETS["Slowed Tape"], "noise_seed": 9},
+    "tempo and pitch": {**presets.PRESETS["Cozy Vinyl"], "bitcrush": 0.3, "noise_seed": 9},
+}
+
+
+def _audio(seconds):
+    rng = np.random.default_rng(2)
+    t = np.arange(int(seconds * SR)) / SR
+    audio = 0.5 * np.sin(2 * np.pi * 220 * t)[:, None] * np.ones(2) + 0.05 * rng.standard_normal((len(t), 2))
+    return audio.astype(np.float32)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+@pytest.mark.parametrize("case", list(CASES))
+def test_render_parallel_matches_apply_pipeline(case, workers):
+    params = CASES[case]
+    pre_roll = dsp.pre_roll_seconds(params)
+    # Long enough for every worker to get a segment
+    audio = _audio(workers * 4 * pre_roll * 1.2 / dsp.output_scale(params))
+    assert len(parallel.plan_segments(parallel.output_length(len(audio), params), SR, {}, workers, pre_roll)) == workers
+    expected = dsp.apply_pipeline(audio, SR, params)
+    rendered = parallel.render_parallel(audio, SR, params, workers)
+    assert rendered.shape == expected.shape
+    np.testing.assert_allclose(rendered, expected, rtol=0, atol=TOLERANCE)
@@ -0,0 +1,29 @@
+import pytest
+
+from lofi_app import dsp, presets
+
+
+def _through_sliders(preset):
+    """The params the GUI renders after apply_preset and _current_params."""
+    params = dict(preset)
+    for key in presets.SLIDER_RANGES:
+        if key in preset:
+            params[key] = presets.slider_value(key, presets.slider_position(key, preset[key]))
+    return params
+
+
+@pytest.mark.parametrize("name", list(presets.PRESETS))
+def test_sliders_keep_neutral_stages_out_of_the_pipeline(name):
+    preset = presets.PRESETS[name]
+    stages = [stage for stage, _, _ in dsp.PipelinePlan(44100, _through_sliders(preset)).stages]
+    tempo_pitch = preset.get("time_stretch", 1.0) != 1.0 or preset.get("pitch_shift", 0.0) != 0.0
+    assert ("tempo_pitch" in stages) == tempo_pitch
+    assert ("varispeed" in stages) == (preset.get("varispeed", 1.0) != 1.0)
+
+
+@pytest.mark.parametrize("name", list(presets.PRESETS))
+def test_sliders_round_trip_within_half_a_step(name):
+    params = _through_sliders(presets.PRESETS[name])
+    for key, (low, high) in presets.SLIDER_RANGES.items():
+        if key in params:
+            assert abs(params[key] - presets.PRESETS[name][key]) <= (high - low) / presets.SLIDER_STEPS / 2
@@ -0,0 +1,24 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from lofi_app import dsp, profiling
+
+SR = 44100
+
+
+@pytest.mark.parametrize("reset_peak", [True, False], ids=["reset_peak", "restart"])
+def test_allocations_are_reported_per_stage(monkeypatch, reset_peak):
+    if not reset_peak:
+        # Python 3.8 has no tracemalloc.reset_peak
+        monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+    audio = np.zeros((SR, 2), dtype=np.float32)
+    profiler = profiling.StageProfiler(trace_memory=True)
+    dsp.apply_pipeline(audio, SR, {"saturation": 0.5}, observer=profiler)
+    assert not tracemalloc.is_tracing()
+    assert profiler.stages and all(totals["allocated"] is not None for totals in profiler.stages.values())
+
+    with profiling.tracing(profiler):
+        profiling.observe(profiler, "copy", audio, audio.copy)
+    assert profiler.stages["copy"]["allocated"] >= audio.nbytes
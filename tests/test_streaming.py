@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from lofi_app import dsp, presets, reverb, streaming
+
+SR = 44100
+# Float rounding differs between whole-array and block-wise kernels. Bitcrush
+# turns such a difference into a whole quantisation step where a sample sits
+# on a step boundary, so its presets get a looser bound.
+TOLERANCE = 3e-5
+BITCRUSH_TOLERANCE = 1e-3
+
+
+def _audio(seconds, channels):
+    rng = np.random.default_rng(5)
+    t = np.arange(int(seconds * SR)) / SR
+    audio = 0.4 * np.sin(2 * np.pi * 220 * t)[:, None] * np.ones(channels)
+    audio += 0.1 * rng.standard_normal(audio.shape)
+    # A transient for the compressor and limiter
+    audio[SR // 10 : SR // 10 + 200] *= 4
+    return audio.astype(np.float32)
+
+
+def _stream(audio, params, block_size):
+    blocks = (audio[i : i + block_size] for i in range(0, len(audio), block_size))
+    return np.concatenate(list(streaming.iter_pipeline(blocks, SR, audio.shape[1], params)))
+
+
+@pytest.mark.parametrize("channels", [1, 2])
+# Smaller than a filter block and a reverb partition, unaligned with a partition, and larger than both
+@pytest.mark.parametrize("block_size", [100, reverb.PARTITION_SIZE + 1, 65536])
+@pytest.mark.parametrize("name", list(presets.PRESETS))
+def test_streaming_matches_apply_pipeline(name, block_size, channels):
+    # iter_pipeline leaves the limiter to its caller
+    params = {**presets.PRESETS[name], "noise_seed": 11, "limiter": 0.0}
+    audio = _audio(2.0, channels)
+    expected = dsp.apply_pipeline(audio, SR, params)
+    streamed = _stream(audio, params, block_size)
+    assert streamed.shape == expected.shape
+    tolerance = BITCRUSH_TOLERANCE if params.get("bitcrush", 0.0) > 0.0 else TOLERANCE
+    np.testing.assert_allclose(streamed, expected, rtol=0, atol=tolerance)
+
+
+@pytest.mark.parametrize("name", ["Cozy Vinyl", "Midnight Radio", "Slowed Tape"])
+def test_streaming_matches_apply_pipeline_on_short_noisy_input(name):
+    params = {**presets.PRESETS[name], "noise": 0.5, "noise_seed": 11, "limiter": 0.0}
+    audio = _audio(0.25, 2)
+    expected = dsp.apply_pipeline(audio, SR, params)
+    streamed = _stream(audio, params, 1000)
+    assert streamed.shape == expected.shape
+    tolerance = BITCRUSH_TOLERANCE if params.get("bitcrush", 0.0) > 0.0 else TOLERANCE
+    np.testing.assert_allclose(streamed, expected, rtol=0, atol=tolerance)